@@ -5,110 +5,227 @@ Provides machine learning insights and advanced data visualization
 
 import sqlite3
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import json
+from bisect import bisect_right
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from importlib.util import find_spec
+from operator import itemgetter
 import math
 
-# Optional imports for advanced analytics
-try:
-    import numpy as np
-    import pandas as pd
-    from sklearn.ensemble import RandomForestRegressor
-    from sklearn.linear_model import LinearRegression
-    from sklearn.model_selection import train_test_split
-    from sklearn.preprocessing import StandardScaler
-    import matplotlib.pyplot as plt
-    import matplotlib
-    matplotlib.use('Agg')  # Use non-interactive backend
-    import seaborn as sns
-    ANALYTICS_LIBS_AVAILABLE = True
-except ImportError as e:
-    print(f"Advanced analytics libraries not available: {e}")
-    ANALYTICS_LIBS_AVAILABLE = False
-    # Create dummy objects to prevent errors
-    class DummyPandas:
-        @staticmethod
-        def DataFrame(*args, **kwargs):
-            return None
-        @staticmethod
-        def read_sql_query(*args, **kwargs):
-            return None
+import numpy as np
+
+# pandas is only needed by get_dataframe_from_query and is imported there on first use
+PANDAS_AVAILABLE = find_spec('pandas') is not None
+
+# Lower edges of the D, C, B and A grade buckets
+GRADE_BUCKET_EDGES = (60, 70, 80, 90)
+
+# Insight lookup tables: bisect_right(edges, value) indexes the message, so each
+# edge is the inclusive lower bound of the next message
+CLASS_MEAN_INSIGHTS = ((65, 75, 85), (
+    "Class performance needs improvement - intervention recommended.",
+    "Class performance is average - consider additional support.",
+    "Class performance is above average.",
+    "Class is performing excellently with high average scores.",
+))
+ATTENDANCE_RATE_INSIGHTS = ((75, 85, 95), (
+    "Poor attendance - immediate intervention required.",
+    "Attendance needs improvement - consider intervention.",
+    "Good attendance with room for improvement.",
+    "Excellent attendance record.",
+))
+
+# Seconds a cached analytic is kept even when no table version moved, as a backstop
+# for writes that bypass the table_versions triggers
+ANALYTICS_CACHE_TTL = 300
+
+# Last system-wide result as {'system': (fingerprint, analytics)}, shared by all threads
+_system_analytics_cache = {}
+_system_analytics_lock = threading.Lock()
+
+# Per-connection tuning; journal_mode is set by app.py and persisted in the database file
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+]
+
+def linreg_stats(n: int, sum_x: float, sum_y: float, sum_x2: float,
+                 sum_xy: float, sum_y2: float) -> Tuple[float, float, float]:
+    """Least-squares slope, intercept and residual variance from running sums"""
+    # Centred sums of squares and cross-products
+    s_xx = sum_x2 - sum_x * sum_x / n
+    s_xy = sum_xy - sum_x * sum_y / n
+    s_yy = sum_y2 - sum_y * sum_y / n
     
-    class DummyNumpy:
-        @staticmethod
-        def array(*args, **kwargs):
-            return []
-        @staticmethod
-        def mean(*args, **kwargs):
-            return 0
-        @staticmethod
-        def std(*args, **kwargs):
-            return 0
+    slope = s_xy / s_xx
+    intercept = (sum_y - slope * sum_x) / n
     
-    pd = DummyPandas()
-    np = DummyNumpy()
+    # Mean squared residual: var(y) - slope^2 var(x), with slope^2 * s_xx == slope * s_xy
+    variance = (s_yy - slope * s_xy) / n
+    return slope, intercept, max(0.0, variance)
+
+# Graded assignment rows feeding the class-wide statistics, fetched as columns
+CLASS_GRADES_QUERY = """
+    SELECT a.subject_id, a.grade
+    FROM assignments a
+    JOIN users u ON a.user_id = u.id
+    WHERE {where_clause} AND a.grade IS NOT NULL AND a.grade > 0
+"""
+
+# 0-100 grades fit float32 at half the bytes; reductions still accumulate in float64
+CLASS_GRADES_DTYPES = ('int64', 'float32')
+
+# Per-student grade aggregates, best average first; sum_sq_dev feeds the sample std
+CLASS_STUDENTS_QUERY = """
+    SELECT a.subject_id, a.user_id, u.username, u.full_name,
+           AVG(a.grade) AS average_grade,
+           COUNT(*) AS assignment_count,
+           SUM(a.grade * a.grade) - SUM(a.grade) * AVG(a.grade) AS sum_sq_dev
+    FROM assignments a
+    JOIN users u ON a.user_id = u.id
+    WHERE {where_clause} AND a.grade IS NOT NULL AND a.grade > 0
+    GROUP BY a.subject_id, a.user_id
+    ORDER BY a.subject_id, ROUND(AVG(a.grade), 2) DESC, a.user_id
+"""
+
+# Attendance rolled up per group key by weekday, month and subject:
+# rows of (group key, dimension, label, present count, total count)
+ATTENDANCE_ROLLUP_QUERY = """
+    WITH rows AS (
+        SELECT att.present, {group_key} AS group_key, s.name AS subject_name,
+               COALESCE(CAST(strftime('%w', att.date) AS INTEGER), 7) AS day_of_week,
+               strftime('%Y-%m', att.date) AS month_year
+        FROM attendance att
+        JOIN subjects s ON att.subject_id = s.id
+        JOIN users u ON att.user_id = u.id
+        WHERE {where_clause}
+    )
+    SELECT group_key, 'day', day_of_week, TOTAL(present), COUNT(*)
+    FROM rows GROUP BY group_key, day_of_week
+    UNION ALL
+    SELECT group_key, 'month', month_year, TOTAL(present), COUNT(*)
+    FROM rows WHERE month_year IS NOT NULL GROUP BY group_key, month_year
+    UNION ALL
+    SELECT group_key, 'subject', subject_name, TOTAL(present), COUNT(*)
+    FROM rows GROUP BY group_key, subject_name
+    ORDER BY 1, 2, 3
+"""
 
 class AdvancedAnalytics:
     def __init__(self):
         self.database = os.path.join(os.path.dirname(__file__), 'school.db')
+        self._local = threading.local()
+        # Long-lived workers so their thread-local connections are reused across requests
+        self._executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='analytics')
+    
+    def _conn(self):
+        """Return this thread's tuned connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.database == self.database:
+            return conn
+        
+        conn = sqlite3.connect(self.database, isolation_level=None)
+        self._local.conn = conn
+        self._local.database = self.database
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        
+        return conn
     
     def get_dataframe_from_query(self, query: str, params: tuple = ()):
         """Execute query and return pandas DataFrame"""
-        if not ANALYTICS_LIBS_AVAILABLE:
+        if not PANDAS_AVAILABLE:
             return None
         
-        conn = sqlite3.connect(self.database)
+        import pandas as pd
         try:
-            df = pd.read_sql_query(query, conn, params=params)
+            df = pd.read_sql_query(query, self._conn(), params=params)
             return df
         except Exception as e:
             print(f"Query error: {e}")
             return None
-        finally:
-            conn.close()
+    
+    def _fetch_cols(self, query: str, params: tuple, dtypes: tuple) -> List:
+        """Execute query and return one numpy array per result column"""
+        rows = self._conn().execute(query, params).fetchall()
+        return [np.fromiter(map(itemgetter(i), rows), dtype=dtype, count=len(rows))
+                for i, dtype in enumerate(dtypes)]
+    
+    def _fetch_rows(self, query: str, params: tuple = ()) -> List[tuple]:
+        """Execute query and return all rows"""
+        return self._conn().execute(query, params).fetchall()
+    
+    def _fetch_records(self, query: str, params: tuple = ()) -> List[Dict]:
+        """Execute query and return its rows as column-name dicts"""
+        cur = self._conn().execute(query, params)
+        columns = [description[0] for description in cur.description]
+        return [dict(zip(columns, row)) for row in cur]
+    
+    def _data_version(self, *tables: str) -> tuple:
+        """Change counters of the tables an analytic reads, used as its cache key"""
+        cur = self._conn().execute(
+            f"SELECT table_name, version FROM table_versions "
+            f"WHERE table_name IN ({', '.join('?' * len(tables))}) ORDER BY table_name",
+            tables
+        )
+        # The time bucket retires entries after ANALYTICS_CACHE_TTL even if no counter moved
+        return (self.database, int(time.monotonic() // ANALYTICS_CACHE_TTL), *cur)
     
     def predict_student_performance(self, student_id: int) -> Dict:
         """Predict future performance based on historical data"""
-        # Get historical grades
-        query = """
-            SELECT a.grade, a.id, s.name as subject_name, 
-                   julianday('now') - julianday(datetime(a.id, 'unixepoch')) as days_ago
-            FROM assignments a
-            JOIN subjects s ON a.subject_id = s.id
-            WHERE a.user_id = ? AND a.grade IS NOT NULL AND a.grade > 0
-            ORDER BY a.id
-        """
-        
-        df = self.get_dataframe_from_query(query, (student_id,))
+        version = self._data_version('assignments', 'subjects')
+        return self._predict_student_performance(student_id, version)
+    
+    @lru_cache(maxsize=512)
+    def _predict_student_performance(self, student_id: int, version: tuple) -> Dict:
+        conn = self._conn()
+        cur = conn.cursor()
         
-        if df.empty or len(df) < 3:
+        # One pass over the student's grades: regression sums over (x = assignment index,
+        # y = grade) per subject, plus the subject trend, since the mean of successive
+        # differences is (last - first) / (count - 1)
+        cur.execute("""
+            WITH g AS (
+                SELECT s.name AS subject_name, a.grade, a.id,
+                       ROW_NUMBER() OVER (ORDER BY a.id) - 1 AS x,
+                       ROW_NUMBER() OVER (PARTITION BY s.name ORDER BY a.id) AS rn,
+                       COUNT(*) OVER (PARTITION BY s.name) AS cnt
+                FROM assignments a
+                JOIN subjects s ON a.subject_id = s.id
+                WHERE a.user_id = ? AND a.grade IS NOT NULL AND a.grade > 0
+            )
+            SELECT subject_name, COUNT(*), SUM(grade), SUM(grade * grade),
+                   SUM(x), SUM(x * x), SUM(x * grade),
+                   SUM(CASE WHEN rn = cnt THEN grade END) - SUM(CASE WHEN rn = 1 THEN grade END)
+            FROM g
+            GROUP BY subject_name
+            ORDER BY MIN(id)
+        """, (student_id,))
+        subject_rows = cur.fetchall()
+        
+        totals = [sum(column) for column in zip(*(row[1:7] for row in subject_rows))]
+        n, sum_y, sum_y2, sum_x, sum_x2, sum_xy = totals or (0,) * 6
+        
+        if n < 3:
             return {'error': 'Insufficient data for prediction'}
         
-        # Simple linear regression for trend analysis
-        x = np.arange(len(df))
-        y = df['grade'].values
-        
-        # Calculate trend
-        n = len(x)
-        sum_x = np.sum(x)
-        sum_y = np.sum(y)
-        sum_xy = np.sum(x * y)
-        sum_x2 = np.sum(x * x)
-        
-        # Linear regression coefficients
-        slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x)
-        intercept = (sum_y - slope * sum_x) / n
+        # Linear regression coefficients and residual variance
+        slope, intercept, variance = linreg_stats(n, sum_x, sum_y, sum_x2, sum_xy, sum_y2)
         
         # Predict next performance
-        next_x = len(df)
+        next_x = n
         predicted_grade = slope * next_x + intercept
         predicted_grade = max(0, min(100, predicted_grade))  # Clamp between 0-100
         
         # Calculate confidence based on variance
-        residuals = y - (slope * x + intercept)
-        variance = np.var(residuals)
         confidence = max(0, min(100, 100 - variance))
         
         # Performance trend
@@ -121,80 +238,78 @@ class AdvancedAnalytics:
         
         # Subject-wise analysis
         subject_performance = {}
-        for subject in df['subject_name'].unique():
-            subject_df = df[df['subject_name'] == subject]
-            if len(subject_df) >= 2:
-                subject_avg = subject_df['grade'].mean()
-                subject_trend = subject_df['grade'].diff().mean()
-                subject_performance[subject] = {
-                    'average': round(subject_avg, 2),
-                    'trend': 'improving' if subject_trend > 0 else 'declining' if subject_trend < 0 else 'stable',
-                    'assignments_count': len(subject_df)
-                }
+        for subject, subject_count, subject_sum, *_, subject_delta in subject_rows:
+            if subject_count < 2:
+                continue
+            subject_performance[subject] = {
+                'average': round(subject_sum / subject_count, 2),
+                'trend': 'improving' if subject_delta > 0 else 'declining' if subject_delta < 0 else 'stable',
+                'assignments_count': subject_count
+            }
         
         return {
             'predicted_grade': round(predicted_grade, 2),
             'confidence': round(confidence, 2),
             'trend': trend,
-            'current_average': round(df['grade'].mean(), 2),
+            'current_average': round(sum_y / n, 2),
             'improvement_rate': round(slope, 3),
             'subject_performance': subject_performance,
-            'data_points': len(df)
+            'data_points': n
         }
     
     def analyze_class_performance(self, subject_id: int) -> Dict:
         """Analyze overall class performance for a subject"""
-        query = """
-            SELECT a.grade, a.user_id, u.username, u.full_name,
-                   COUNT(*) OVER (PARTITION BY a.user_id) as assignment_count
-            FROM assignments a
-            JOIN users u ON a.user_id = u.id
-            WHERE a.subject_id = ? AND a.grade IS NOT NULL AND a.grade > 0
-        """
-        
-        df = self.get_dataframe_from_query(query, (subject_id,))
-        
-        if df.empty:
+        version = self._data_version('assignments', 'users')
+        return self._analyze_class_performance(subject_id, version)
+    
+    @lru_cache(maxsize=512)
+    def _analyze_class_performance(self, subject_id: int, version: tuple) -> Dict:
+        where_clause = "a.subject_id = ?"
+        _, grades = self._fetch_cols(
+            CLASS_GRADES_QUERY.format(where_clause=where_clause), (subject_id,), CLASS_GRADES_DTYPES)
+        student_rows = self._conn().execute(
+            CLASS_STUDENTS_QUERY.format(where_clause=where_clause), (subject_id,)).fetchall()
+        return self._class_performance(grades, student_rows)
+    
+    def _class_performance(self, grades, student_rows: List[tuple]) -> Dict:
+        """Class performance analytics from a subject's grades and per-student aggregates"""
+        if not len(grades):
             return {'error': 'No grade data available'}
         
         # Basic statistics
         stats = {
-            'mean': round(df['grade'].mean(), 2),
-            'median': round(df['grade'].median(), 2),
-            'std_dev': round(df['grade'].std(), 2),
-            'min': round(df['grade'].min(), 2),
-            'max': round(df['grade'].max(), 2),
-            'total_students': df['user_id'].nunique(),
-            'total_assignments': len(df)
+            'mean': round(float(grades.mean(dtype=np.float64)), 2),
+            'median': round(float(np.median(grades)), 2),
+            'std_dev': round(float(grades.std(ddof=1, dtype=np.float64)) if len(grades) > 1 else float('nan'), 2),
+            'min': round(float(grades.min()), 2),
+            'max': round(float(grades.max()), 2),
+            'total_students': len(student_rows),
+            'total_assignments': len(grades)
         }
         
-        # Performance distribution
+        # Performance distribution: one pass over the grades, bucket edges at 60/70/80/90
+        counts = np.bincount(np.searchsorted(GRADE_BUCKET_EDGES, grades, side='right'), minlength=5)
         grade_ranges = {
-            'A (90-100)': len(df[df['grade'] >= 90]),
-            'B (80-89)': len(df[(df['grade'] >= 80) & (df['grade'] < 90)]),
-            'C (70-79)': len(df[(df['grade'] >= 70) & (df['grade'] < 80)]),
-            'D (60-69)': len(df[(df['grade'] >= 60) & (df['grade'] < 70)]),
-            'F (0-59)': len(df[df['grade'] < 60])
+            'A (90-100)': int(counts[4]),
+            'B (80-89)': int(counts[3]),
+            'C (70-79)': int(counts[2]),
+            'D (60-69)': int(counts[1]),
+            'F (0-59)': int(counts[0])
         }
         
-        # Student performance analysis
-        student_stats = df.groupby(['user_id', 'username', 'full_name']).agg({
-            'grade': ['mean', 'count', 'std']
-        }).round(2)
-        
-        student_performance = []
-        for idx, row in student_stats.iterrows():
-            student_performance.append({
-                'user_id': idx[0],
-                'username': idx[1],
-                'full_name': idx[2],
-                'average_grade': row[('grade', 'mean')],
-                'assignment_count': row[('grade', 'count')],
-                'consistency': round(100 - row[('grade', 'std')] if not pd.isna(row[('grade', 'std')]) else 100, 2)
-            })
-        
-        # Sort by average grade
-        student_performance.sort(key=lambda x: x['average_grade'], reverse=True)
+        # Student performance analysis, already aggregated and sorted by average grade in SQL
+        student_performance = [
+            {
+                'user_id': user_id,
+                'username': username,
+                'full_name': full_name,
+                'average_grade': round(average, 2),
+                'assignment_count': count,
+                'consistency': round(100 - round(math.sqrt(max(sum_sq_dev, 0) / (count - 1)), 2)
+                                     if count > 1 else 100, 2)
+            }
+            for _, user_id, username, full_name, average, count, sum_sq_dev in student_rows
+        ]
         
         # Risk assessment
         at_risk_students = [
@@ -214,14 +329,8 @@ class AdvancedAnalytics:
         """Generate insights based on class performance"""
         insights = []
         
-        if stats['mean'] >= 85:
-            insights.append("Class is performing excellently with high average scores.")
-        elif stats['mean'] >= 75:
-            insights.append("Class performance is above average.")
-        elif stats['mean'] >= 65:
-            insights.append("Class performance is average - consider additional support.")
-        else:
-            insights.append("Class performance needs improvement - intervention recommended.")
+        edges, messages = CLASS_MEAN_INSIGHTS
+        insights.append(messages[bisect_right(edges, stats['mean'])])
         
         if stats['std_dev'] > 15:
             insights.append("High grade variance indicates diverse performance levels.")
@@ -239,6 +348,11 @@ class AdvancedAnalytics:
     
     def analyze_attendance_patterns(self, student_id: int = None, subject_id: int = None) -> Dict:
         """Analyze attendance patterns and identify trends"""
+        version = self._data_version('attendance', 'subjects', 'users')
+        return self._analyze_attendance_patterns(student_id, subject_id, version)
+    
+    @lru_cache(maxsize=512)
+    def _analyze_attendance_patterns(self, student_id: int, subject_id: int, version: tuple) -> Dict:
         query_conditions = []
         params = []
         
@@ -252,54 +366,37 @@ class AdvancedAnalytics:
         
         where_clause = " AND ".join(query_conditions) if query_conditions else "1=1"
         
-        query = f"""
-            SELECT att.*, s.name as subject_name, u.username, u.full_name,
-                   strftime('%w', att.date) as day_of_week,
-                   strftime('%Y-%m', att.date) as month_year
-            FROM attendance att
-            JOIN subjects s ON att.subject_id = s.id
-            JOIN users u ON att.user_id = u.id
-            WHERE {where_clause}
-            ORDER BY att.date DESC
-        """
-        
-        df = self.get_dataframe_from_query(query, tuple(params))
-        
-        if df.empty:
+        query = ATTENDANCE_ROLLUP_QUERY.format(group_key="0", where_clause=where_clause)
+        rollups = [row[1:] for row in self._conn().execute(query, tuple(params))]
+        return self._attendance_from_rollups(rollups, include_subjects=not subject_id)
+    
+    def _attendance_from_rollups(self, rollups: List[tuple], include_subjects: bool = True) -> Dict:
+        """Attendance analytics from (dimension, label, present, total) rollup rows"""
+        if not rollups:
             return {'error': 'No attendance data available'}
         
-        # Overall attendance rate
-        total_records = len(df)
-        present_records = df['present'].sum()
-        attendance_rate = (present_records / total_records) * 100
-        
-        # Day of week patterns
         day_names = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
         day_patterns = {}
-        
-        for day_num in range(7):
-            day_data = df[df['day_of_week'] == str(day_num)]
-            if not day_data.empty:
-                day_rate = (day_data['present'].sum() / len(day_data)) * 100
-                day_patterns[day_names[day_num]] = round(day_rate, 2)
-        
-        # Monthly trends
-        monthly_trends = df.groupby('month_year').agg({
-            'present': ['sum', 'count']
-        })
-        
         monthly_rates = {}
-        for month, data in monthly_trends.iterrows():
-            rate = (data[('present', 'sum')] / data[('present', 'count')]) * 100
-            monthly_rates[month] = round(rate, 2)
-        
-        # Subject-wise attendance (if not filtered by subject)
         subject_attendance = {}
-        if not subject_id:
-            for subject in df['subject_name'].unique():
-                subject_data = df[df['subject_name'] == subject]
-                subject_rate = (subject_data['present'].sum() / len(subject_data)) * 100
-                subject_attendance[subject] = round(subject_rate, 2)
+        total_records = 0
+        present_records = 0
+        
+        for dimension, label, present, total in rollups:
+            rate = round((present / total) * 100, 2)
+            if dimension == 'day':
+                # Every row has exactly one weekday code, so these also give the overall totals
+                total_records += total
+                present_records += int(present)
+                if label < 7:
+                    day_patterns[day_names[label]] = rate
+            elif dimension == 'month':
+                monthly_rates[label] = rate
+            elif include_subjects:
+                subject_attendance[label] = rate
+        
+        # Overall attendance rate
+        attendance_rate = (present_records / total_records) * 100
         
         return {
             'overall_attendance_rate': round(attendance_rate, 2),
@@ -316,14 +413,8 @@ class AdvancedAnalytics:
         """Generate insights from attendance analysis"""
         insights = []
         
-        if overall_rate >= 95:
-            insights.append("Excellent attendance record.")
-        elif overall_rate >= 85:
-            insights.append("Good attendance with room for improvement.")
-        elif overall_rate >= 75:
-            insights.append("Attendance needs improvement - consider intervention.")
-        else:
-            insights.append("Poor attendance - immediate intervention required.")
+        edges, messages = ATTENDANCE_RATE_INSIGHTS
+        insights.append(messages[bisect_right(edges, overall_rate)])
         
         # Day patterns
         if day_patterns:
@@ -365,23 +456,47 @@ class AdvancedAnalytics:
         
         elif role == 'teacher':
             # Teacher-specific analytics - analyze all their classes
-            conn = sqlite3.connect(self.database)
+            conn = self._conn()
             cur = conn.cursor()
             
             # Get teacher's subjects
             cur.execute("SELECT id, name FROM subjects WHERE teacher_id = ?", (user_id,))
             subjects = cur.fetchall()
-            conn.close()
             
             class_analytics = {}
-            for subject_id, subject_name in subjects:
-                class_performance = self.analyze_class_performance(subject_id)
-                attendance_analysis = self.analyze_attendance_patterns(subject_id=subject_id)
+            if subjects:
+                # One query per analytic for all of the teacher's subjects, split per subject
+                subject_ids = tuple(subject_id for subject_id, _ in subjects)
+                placeholders = ",".join("?" * len(subject_ids))
+                where_clause = f"a.subject_id IN ({placeholders})"
+                
+                # The three reads are independent; under WAL they run concurrently on the
+                # executor's own connections, and sqlite3 releases the GIL while stepping
+                grades_future = self._executor.submit(
+                    self._fetch_cols, CLASS_GRADES_QUERY.format(where_clause=where_clause),
+                    subject_ids, CLASS_GRADES_DTYPES)
+                students_future = self._executor.submit(
+                    self._fetch_rows, CLASS_STUDENTS_QUERY.format(where_clause=where_clause), subject_ids)
+                attendance_future = self._executor.submit(
+                    self._fetch_rows, ATTENDANCE_ROLLUP_QUERY.format(
+                        group_key="att.subject_id", where_clause=f"att.subject_id IN ({placeholders})"),
+                    subject_ids)
                 
-                class_analytics[subject_name] = {
-                    'performance': class_performance,
-                    'attendance': attendance_analysis
-                }
+                grade_subjects, grades = grades_future.result()
+                student_rows = defaultdict(list)
+                for row in students_future.result():
+                    student_rows[row[0]].append(row)
+                attendance_rollups = defaultdict(list)
+                for subject_id, *rollup in attendance_future.result():
+                    attendance_rollups[subject_id].append(tuple(rollup))
+                
+                for subject_id, subject_name in subjects:
+                    class_analytics[subject_name] = {
+                        'performance': self._class_performance(
+                            grades[grade_subjects == subject_id], student_rows[subject_id]),
+                        'attendance': self._attendance_from_rollups(
+                            attendance_rollups[subject_id], include_subjects=False)
+                    }
             
             dashboard_data = {
                 'class_analytics': class_analytics,
@@ -396,8 +511,22 @@ class AdvancedAnalytics:
     
     def generate_system_analytics(self) -> Dict:
         """Generate system-wide analytics for administrators"""
-        conn = sqlite3.connect(self.database)
-        
+        conn = self._conn()
+        
+        # Reused by every thread until the assignments, users or subjects change
+        version = self._data_version('assignments', 'subjects', 'users')
+        with _system_analytics_lock:
+            cached = _system_analytics_cache.get('system')
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        
+        system_analytics = self._system_analytics(conn)
+        with _system_analytics_lock:
+            _system_analytics_cache['system'] = (version, system_analytics)
+        return system_analytics
+    
+    def _system_analytics(self, conn) -> Dict:
+        """System-wide statistics, monthly trends and subject comparison"""
         # Overall statistics
         cur = conn.cursor()
         cur.execute("""
@@ -413,7 +542,7 @@ class AdvancedAnalytics:
         
         # Performance trends by month
         query = """
-            SELECT strftime('%Y-%m', datetime(a.id, 'unixepoch')) as month,
+            SELECT strftime('%Y-%m', a.date_created) as month,
                    AVG(a.grade) as avg_grade,
                    COUNT(*) as assignment_count
             FROM assignments a
@@ -423,7 +552,7 @@ class AdvancedAnalytics:
             LIMIT 12
         """
         
-        monthly_performance = self.get_dataframe_from_query(query)
+        monthly_performance = self._fetch_records(query)
         
         # Subject performance comparison
         query = """
@@ -438,14 +567,12 @@ class AdvancedAnalytics:
             ORDER BY avg_grade DESC
         """
         
-        subject_performance = self.get_dataframe_from_query(query)
-        
-        conn.close()
+        subject_performance = self._fetch_records(query)
         
         return {
             'system_statistics': system_stats,
-            'monthly_trends': monthly_performance.to_dict('records') if not monthly_performance.empty else [],
-            'subject_comparison': subject_performance.to_dict('records') if not subject_performance.empty else [],
+            'monthly_trends': monthly_performance,
+            'subject_comparison': subject_performance,
             'type': 'admin'
         }
 
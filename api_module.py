@@ -3,107 +3,321 @@ RESTful API Module
 Provides external API access to the education management system
 """
 
-from flask import Blueprint, jsonify, request, g
+from flask import Blueprint, Response, request, g, stream_with_context
 from functools import wraps
+from contextlib import closing
 import sqlite3
 import os
+import threading
+import time
+import atexit
+import base64
 import hashlib
+import hmac
+import json
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import jwt
 
+from db_pool import ConnectionPool, PoolTimeout
+
+# orjson serializes API payloads several times faster; stdlib json is the fallback
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Create API blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
 
 # API Configuration
-API_SECRET_KEY = 'your-api-secret-key-here'
+# Signs API tokens; set it in the environment so tokens survive restarts and are
+# accepted by every worker, otherwise a random per-process key is used
+API_SECRET_KEY = os.environ.get('API_SECRET_KEY')
+if not API_SECRET_KEY:
+    API_SECRET_KEY = secrets.token_urlsafe(32)
+    print("⚠ API_SECRET_KEY is not set: API tokens are signed with a random per-process key "
+          "and stop working after a restart or on another worker")
+API_TOKEN_TTL = timedelta(hours=1)
 DATABASE = os.path.join(os.path.dirname(__file__), 'school.db')
 
+# Per-connection tuning; journal_mode=WAL is persisted in the database file
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+]
+
+# Bounded pool of connections shared by all request threads; a request holds one
+# from its first query until teardown, which for streamed responses is the end
+# of the stream
+API_POOL_SIZE = 8
+# Seconds a request waits for a free connection before it is answered with a 503
+API_POOL_TIMEOUT = 5
+_pool = ConnectionPool(DATABASE, CONNECTION_PRAGMAS, API_POOL_SIZE, API_POOL_TIMEOUT)
+
+# init_api_tables runs once per process, from register_api
+_init_lock = threading.Lock()
+_tables_initialized = False
+
+# Key usage and request logs are buffered in memory and written in one
+# transaction per interval instead of two commits per request
+USAGE_FLUSH_INTERVAL = 1.0
+_usage_lock = threading.Lock()
+_pending_usage = {}  # key_id -> [request count, last used timestamp]
+_pending_logs = []
+_flusher = None
+
+# Successful key verifications are reused for a short TTL, so a revoked or
+# expired key stops working within API_KEY_CACHE_TTL seconds
+API_KEY_CACHE_TTL = 60
+API_KEY_CACHE_SIZE = 4096
+_key_cache_lock = threading.Lock()
+_key_cache = {}  # (key_id, secret digest) -> (expiry on the monotonic clock, key info)
+
+# Read endpoints reuse their JSON body for a short TTL; API writes clear it
+RESPONSE_CACHE_TTL = 30
+RESPONSE_CACHE_SIZE = 1024
+_response_cache_lock = threading.Lock()
+_response_cache = {}  # (endpoint, view args, query string) -> (expiry, body)
+_data_change_hooks = []  # callables run after API writes, e.g. to drop the app's own caches
+
+def _get_conn():
+    """Return the current request's pooled connection, checking one out on first use"""
+    if 'api_conn' not in g:
+        g.api_conn = _pool.checkout()
+    return g.api_conn
+
+@api_bp.teardown_request
+def _release_conn(error=None):
+    conn = g.pop('api_conn', None)
+    if conn is not None:
+        _pool.checkin(conn)
+
 def init_api_tables():
     """Initialize API-related tables"""
-    conn = sqlite3.connect(DATABASE)
-    cur = conn.cursor()
-    
-    # API keys table
-    cur.execute('''CREATE TABLE IF NOT EXISTS api_keys (
-        id INTEGER PRIMARY KEY,
-        key_id TEXT UNIQUE,
-        key_hash TEXT,
-        user_id INTEGER,
-        name TEXT,
-        permissions TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        expires_at TIMESTAMP,
-        is_active BOOLEAN DEFAULT 1,
-        last_used TIMESTAMP,
-        usage_count INTEGER DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )''')
-    
-    # API usage logs
-    cur.execute('''CREATE TABLE IF NOT EXISTS api_logs (
-        id INTEGER PRIMARY KEY,
-        api_key_id TEXT,
-        endpoint TEXT,
-        method TEXT,
-        ip_address TEXT,
-        user_agent TEXT,
-        response_code INTEGER,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (api_key_id) REFERENCES api_keys(key_id)
-    )''')
-    
-    conn.commit()
-    conn.close()
+    global _tables_initialized
+    with _init_lock:
+        if _tables_initialized:
+            return
+        
+        # Not pooled, so no connection is left open across a worker fork
+        conn = sqlite3.connect(DATABASE, isolation_level=None)
+        cur = conn.cursor()
+        
+        # Switch to WAL before any schema write, then create everything in one transaction
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("BEGIN")
+        
+        # API keys table
+        cur.execute('''CREATE TABLE IF NOT EXISTS api_keys (
+            id INTEGER PRIMARY KEY,
+            key_id TEXT UNIQUE,
+            key_hash BLOB,
+            user_id INTEGER,
+            name TEXT,
+            permissions TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            last_used TIMESTAMP,
+            usage_count INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )''')
+        
+        # API usage logs
+        cur.execute('''CREATE TABLE IF NOT EXISTS api_logs (
+            id INTEGER PRIMARY KEY,
+            api_key_id TEXT,
+            endpoint TEXT,
+            method TEXT,
+            ip_address TEXT,
+            user_agent TEXT,
+            response_code INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (api_key_id) REFERENCES api_keys(key_id)
+        )''')
+        
+        # key_id is UNIQUE, so api_keys lookups already use its automatic index
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_api_logs_keyid_ts ON api_logs(api_key_id, timestamp)")
+        
+        cur.execute("COMMIT")
+        conn.close()
+        _tables_initialized = True
 
 def generate_api_key() -> tuple:
     """Generate a new API key pair (key_id, secret)"""
     key_id = secrets.token_urlsafe(16)
-    secret = secrets.token_urlsafe(32)
-    key_hash = hashlib.sha256(secret.encode()).hexdigest()
-    return key_id, secret, key_hash
+    # Hash the encoded bytes directly; they are exactly what secret.encode() gives back
+    # when the key is verified, so no str -> bytes round trip is needed here
+    secret_bytes = base64.urlsafe_b64encode(secrets.token_bytes(32)).rstrip(b'=')
+    key_hash = hashlib.sha256(secret_bytes).digest()
+    return key_id, secret_bytes.decode('ascii'), key_hash
+
+def _digest_matches(secret_digest: bytes, key_hash) -> bool:
+    """Constant-time check of a secret's SHA-256 digest against the stored one"""
+    if isinstance(key_hash, str):
+        # Keys created before digests were stored raw hold the hex form
+        try:
+            key_hash = bytes.fromhex(key_hash)
+        except ValueError:
+            return False
+    return hmac.compare_digest(secret_digest, key_hash or b'')
+
+def invalidate_api_key_cache():
+    """Forget cached verifications, e.g. after keys are created or deactivated"""
+    with _key_cache_lock:
+        _key_cache.clear()
 
 def verify_api_key(key_id: str, secret: str) -> dict:
     """Verify API key and return key info"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    secret_digest = hashlib.sha256(secret.encode()).digest()
+    cache_key = (key_id, secret_digest)
+    
+    cached = _key_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        _record_usage(key_id)
+        return dict(cached[1])
     
-    secret_hash = hashlib.sha256(secret.encode()).hexdigest()
+    conn = _get_conn()
+    cur = conn.cursor()
     
     cur.execute("""
         SELECT * FROM api_keys 
-        WHERE key_id = ? AND key_hash = ? AND is_active = 1
+        WHERE key_id = ? AND is_active = 1
         AND (expires_at IS NULL OR expires_at > datetime('now'))
-    """, (key_id, secret_hash))
+    """, (key_id,))
     
     api_key = cur.fetchone()
     
-    if api_key:
-        # Update usage stats
-        cur.execute("""
-            UPDATE api_keys 
-            SET last_used = datetime('now'), usage_count = usage_count + 1
-            WHERE key_id = ?
-        """, (key_id,))
-        conn.commit()
+    if api_key and not _digest_matches(secret_digest, api_key['key_hash']):
+        api_key = None
     
-    conn.close()
-    return dict(api_key) if api_key else None
+    if not api_key:
+        return None
+    
+    # Update usage stats
+    _record_usage(key_id)
+    
+    # Only successful verifications are cached, so bad secrets can't fill the cache
+    api_key = dict(api_key)
+    with _key_cache_lock:
+        if len(_key_cache) >= API_KEY_CACHE_SIZE:
+            _key_cache.pop(next(iter(_key_cache)))
+        _key_cache[cache_key] = (time.monotonic() + API_KEY_CACHE_TTL, api_key)
+    
+    return dict(api_key)
+
+def _utc_timestamp() -> str:
+    """Current UTC time in the format SQLite's datetime('now') produces"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _record_usage(key_id: str):
+    """Count one request against an API key in the pending usage buffer"""
+    with _usage_lock:
+        usage = _pending_usage.setdefault(key_id, [0, None])
+        usage[0] += 1
+        usage[1] = _utc_timestamp()
+    _start_flusher()
 
 def log_api_request(api_key_id: str, endpoint: str, method: str, 
                    ip_address: str, user_agent: str, response_code: int):
     """Log API request"""
-    conn = sqlite3.connect(DATABASE)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        INSERT INTO api_logs (api_key_id, endpoint, method, ip_address, user_agent, response_code)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (api_key_id, endpoint, method, ip_address, user_agent, response_code))
-    
-    conn.commit()
-    conn.close()
+    with _usage_lock:
+        _pending_logs.append((api_key_id, endpoint, method, ip_address, user_agent,
+                              response_code, _utc_timestamp()))
+    _start_flusher()
+
+def flush_api_usage():
+    """Write buffered key usage and request logs in a single transaction"""
+    global _pending_usage, _pending_logs
+    with _usage_lock:
+        usage, _pending_usage = _pending_usage, {}
+        logs, _pending_logs = _pending_logs, []
+    
+    if not usage and not logs:
+        return
+    
+    # Own connection, so slow streamed responses holding the pool can't stall the flush
+    with closing(_pool.connect()) as conn:
+        try:
+            conn.execute("BEGIN")
+            conn.executemany("""
+                UPDATE api_keys 
+                SET last_used = ?, usage_count = usage_count + ?
+                WHERE key_id = ?
+            """, [(last_used, count, key_id) for key_id, (count, last_used) in usage.items()])
+            conn.executemany("""
+                INSERT INTO api_logs (api_key_id, endpoint, method, ip_address, user_agent, response_code, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, logs)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"API usage flush error: {e}")
+
+def _flush_loop():
+    """Background thread body: flush the usage buffers every interval"""
+    while True:
+        time.sleep(USAGE_FLUSH_INTERVAL)
+        flush_api_usage()
+
+def _start_flusher():
+    """Start the background flush thread, again after a fork left it behind"""
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _usage_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name='api-usage-flush', daemon=True)
+            _flusher.start()
+
+atexit.register(flush_api_usage)
+
+def _token_expiry(now: datetime, expires_at=None) -> datetime:
+    """API_TOKEN_TTL after now, but no later than the key's own expires_at"""
+    exp = now + API_TOKEN_TTL
+    if expires_at:
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        # Stored naive and compared against datetime('now'), i.e. as UTC
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        exp = min(exp, expires_at)
+    return exp
+
+def issue_api_token(key_id: str, user_id: int, permissions: str, expires_at=None) -> str:
+    """Issue a short-lived HS256 token standing in for an API key"""
+    now = datetime.now(timezone.utc)
+    claims = {
+        'kid': key_id,
+        'sub': str(user_id),
+        'perms': permissions,
+        'iat': now,
+        'exp': _token_expiry(now, expires_at)
+    }
+    return jwt.encode(claims, API_SECRET_KEY, algorithm='HS256')
+
+def verify_api_token(token: str) -> dict:
+    """Verify a signed API token without touching the database and return key info"""
+    try:
+        # Pinning algorithms rules out 'none' and algorithm-confusion tokens
+        claims = jwt.decode(token, API_SECRET_KEY, algorithms=['HS256'],
+                            options={'require': ['exp', 'kid', 'sub']})
+    except jwt.InvalidTokenError:
+        return None
+    
+    _record_usage(claims['kid'])
+    return {
+        'key_id': claims['kid'],
+        'user_id': int(claims['sub']) if claims['sub'].isdigit() else None,
+        'permissions': claims.get('perms')
+    }
 
 def require_api_key(f):
     """Decorator to require valid API key for endpoint access"""
@@ -112,26 +326,29 @@ def require_api_key(f):
         auth_header = request.headers.get('Authorization')
         
         if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Missing or invalid API key format'}), 401
+            return json_response({'error': 'Missing or invalid API key format'}), 401
         
-        try:
+        credentials = auth_header[len('Bearer '):]
+        if credentials.count('.') == 2:
+            # Signed token from /auth/token: "Bearer <jwt>"
+            api_key_info = verify_api_token(credentials)
+        else:
             # Parse API key from header: "Bearer key_id:secret"
-            token = auth_header.split(' ')[1]
-            key_id, secret = token.split(':', 1)
-        except (IndexError, ValueError):
-            return jsonify({'error': 'Invalid API key format'}), 401
-        
-        api_key_info = verify_api_key(key_id, secret)
+            key_id, separator, secret = credentials.partition(':')
+            if not separator:
+                return json_response({'error': 'Invalid API key format'}), 401
+            
+            api_key_info = verify_api_key(key_id, secret)
         
         if not api_key_info:
-            return jsonify({'error': 'Invalid or expired API key'}), 401
+            return json_response({'error': 'Invalid or expired API key'}), 401
         
         # Check permissions if specified
         endpoint_permission = f.__name__
         permissions = api_key_info.get('permissions', '').split(',') if api_key_info.get('permissions') else ['all']
         
         if 'all' not in permissions and endpoint_permission not in permissions:
-            return jsonify({'error': 'Insufficient permissions'}), 403
+            return json_response({'error': 'Insufficient permissions'}), 403
         
         # Log the request
         log_api_request(
@@ -148,23 +365,143 @@ def require_api_key(f):
     
     return decorated_function
 
+def dumps(payload) -> bytes:
+    """Serialize a payload to compact JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+def json_response(payload, status: int = 200) -> Response:
+    """JSON response without going through Flask's json provider"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+STREAM_BATCH_SIZE = 256
+
+def stream_rows(cur, key: str) -> Response:
+    """Stream a cursor's rows as {key: [rows], "count": n} without materializing them"""
+    # Plain tuples zipped with the column names once are cheaper than dict(sqlite3.Row)
+    columns = tuple(description[0] for description in cur.description)
+    cur.row_factory = None
+    
+    def generate():
+        try:
+            yield b'{"%s":[' % key.encode()
+            count = 0
+            while True:
+                rows = cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                # One chunk per batch; rows after the first batch need a leading comma
+                chunk = b",".join(dumps(dict(zip(columns, row))) for row in rows)
+                yield (b"," if count else b"") + chunk
+                count += len(rows)
+            yield b'],"count":%d}' % count
+        finally:
+            # Ends the read transaction even if the client disconnects mid-stream
+            cur.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+# Query variants built once at import, keyed by whether a subject filter applies,
+# so each request reuses a fixed SQL string from the connection's statement cache
+_STUDENT_GRADES_BASE = """
+        SELECT a.id, a.name, a.grade, s.name as subject_name, s.id as subject_id,
+               u.full_name as teacher_name
+        FROM assignments a
+        JOIN subjects s ON a.subject_id = s.id
+        LEFT JOIN users u ON s.teacher_id = u.id
+        WHERE a.user_id = ? AND a.grade IS NOT NULL
+    """
+STUDENT_GRADES_QUERIES = {
+    False: _STUDENT_GRADES_BASE + " ORDER BY a.id DESC LIMIT ?",
+    True: _STUDENT_GRADES_BASE + " AND s.id = ? ORDER BY a.id DESC LIMIT ?",
+}
+# The returned grades with their statistics appended to every row, in one round trip
+GRADES_WITH_STATS_QUERIES = {
+    filtered: f"""
+        WITH filtered AS ({query})
+        SELECT *, AVG(grade) OVER (), MAX(grade) OVER (), MIN(grade) OVER (), COUNT(*) OVER ()
+        FROM filtered
+        ORDER BY id DESC
+    """
+    for filtered, query in STUDENT_GRADES_QUERIES.items()
+}
+
+_STUDENT_ATTENDANCE_BASE = """
+        SELECT att.date, att.present, s.name as subject_name, s.id as subject_id
+        FROM attendance att
+        JOIN subjects s ON att.subject_id = s.id
+        WHERE att.user_id = ?
+        AND att.date >= date('now', ?)
+    """
+STUDENT_ATTENDANCE_QUERIES = {
+    False: _STUDENT_ATTENDANCE_BASE + " ORDER BY att.date DESC",
+    True: _STUDENT_ATTENDANCE_BASE + " AND s.id = ? ORDER BY att.date DESC",
+}
+ATTENDANCE_STATS_QUERIES = {
+    filtered: f"SELECT COUNT(*), SUM(CASE WHEN present THEN 1 ELSE 0 END) FROM ({query})"
+    for filtered, query in STUDENT_ATTENDANCE_QUERIES.items()
+}
+
+def on_data_change(callback):
+    """Register a callable to run whenever an API write changes data"""
+    _data_change_hooks.append(callback)
+
+def invalidate_response_cache():
+    """Drop cached read responses after data changes"""
+    with _response_cache_lock:
+        _response_cache.clear()
+
+def _api_data_changed():
+    """Drop cached read responses and run the on_data_change hooks after an API write"""
+    invalidate_response_cache()
+    for callback in _data_change_hooks:
+        callback()
+
+def cached_response(f):
+    """Serve repeat requests for the same URL and query string from memory"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        cache_key = (f.__name__, tuple(sorted(kwargs.items())), request.query_string)
+        
+        cached = _response_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return Response(cached[1], mimetype='application/json')
+        
+        response = f(*args, **kwargs)
+        
+        # Only plain 200 responses are cached; errors come back as (response, status)
+        if isinstance(response, Response) and response.status_code == 200:
+            with _response_cache_lock:
+                if len(_response_cache) >= RESPONSE_CACHE_SIZE:
+                    _response_cache.pop(next(iter(_response_cache)))
+                _response_cache[cache_key] = (time.monotonic() + RESPONSE_CACHE_TTL, response.get_data())
+        
+        return response
+    
+    return decorated_function
+
 # API Endpoints
 
+# Health body rendered at most once per second for load-balancer polling
+HEALTH_TEMPLATE = b'{"status":"healthy","timestamp":"%s","version":"1.0.0"}'
+_health_body = (0.0, b'')  # (monotonic second it was rendered, body)
+
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
-    })
+    global _health_body
+    second = time.monotonic() // 1
+    if _health_body[0] != second:
+        timestamp = datetime.now().isoformat(timespec='seconds').encode()
+        _health_body = (second, HEALTH_TEMPLATE % timestamp)
+    return Response(_health_body[1], mimetype='application/json')
 
 @api_bp.route('/students', methods=['GET'])
 @require_api_key
 def get_students():
     """Get all students"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = _get_conn()
     cur = conn.cursor()
     
     cur.execute("""
@@ -174,160 +511,132 @@ def get_students():
         ORDER BY full_name, username
     """)
     
-    students = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    
-    return jsonify({
-        'students': students,
-        'count': len(students)
-    })
+    return stream_rows(cur, 'students')
 
 @api_bp.route('/students/<int:student_id>', methods=['GET'])
 @require_api_key
+@cached_response
 def get_student(student_id):
     """Get specific student details"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = _get_conn()
     cur = conn.cursor()
     
+    # Student, subjects and recent grades in one round trip, tagged by row kind
     cur.execute("""
-        SELECT id, username, full_name, email, phone
+        SELECT 'student' as kind, id, username, full_name, email, phone
         FROM users 
         WHERE id = ? AND role = 'student'
-    """, (student_id,))
-    
-    student = cur.fetchone()
-    
-    if not student:
-        return jsonify({'error': 'Student not found'}), 404
-    
-    # Get student's subjects
-    cur.execute("""
-        SELECT s.id, s.name, u.full_name as teacher_name
+        UNION ALL
+        SELECT 'subject', s.id, s.name, u.full_name, NULL, NULL
         FROM subjects s
         JOIN enrollments e ON s.id = e.subject_id
         LEFT JOIN users u ON s.teacher_id = u.id
         WHERE e.user_id = ?
-    """, (student_id,))
-    
-    subjects = [dict(row) for row in cur.fetchall()]
-    
-    # Get recent grades
-    cur.execute("""
-        SELECT a.name, a.grade, s.name as subject_name, a.id
-        FROM assignments a
-        JOIN subjects s ON a.subject_id = s.id
-        WHERE a.user_id = ? AND a.grade IS NOT NULL
-        ORDER BY a.id DESC
-        LIMIT 10
-    """, (student_id,))
-    
-    grades = [dict(row) for row in cur.fetchall()]
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'grade', a.id, a.name, a.grade, s.name, NULL
+            FROM assignments a
+            JOIN subjects s ON a.subject_id = s.id
+            WHERE a.user_id = ? AND a.grade IS NOT NULL
+            ORDER BY a.id DESC
+            LIMIT 10
+        )
+    """, (student_id, student_id, student_id))
+    
+    student = None
+    subjects = []
+    grades = []
+    for kind, row_id, name, value, extra, phone in cur.fetchall():
+        if kind == 'student':
+            student = {'id': row_id, 'username': name, 'full_name': value, 'email': extra, 'phone': phone}
+        elif kind == 'subject':
+            subjects.append({'id': row_id, 'name': name, 'teacher_name': value})
+        else:
+            grades.append({'name': name, 'grade': value, 'subject_name': extra, 'id': row_id})
     
-    conn.close()
+    if not student:
+        return json_response({'error': 'Student not found'}), 404
     
-    return jsonify({
-        'student': dict(student),
+    return json_response({
+        'student': student,
         'subjects': subjects,
         'recent_grades': grades
     })
 
 @api_bp.route('/students/<int:student_id>/grades', methods=['GET'])
 @require_api_key
+@cached_response
 def get_student_grades(student_id):
     """Get student's grades with optional filtering"""
     subject_id = request.args.get('subject_id', type=int)
     limit = request.args.get('limit', default=50, type=int)
     
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = _get_conn()
     cur = conn.cursor()
     
-    query = """
-        SELECT a.id, a.name, a.grade, s.name as subject_name, s.id as subject_id,
-               u.full_name as teacher_name
-        FROM assignments a
-        JOIN subjects s ON a.subject_id = s.id
-        LEFT JOIN users u ON s.teacher_id = u.id
-        WHERE a.user_id = ? AND a.grade IS NOT NULL
-    """
-    params = [student_id]
-    
-    if subject_id:
-        query += " AND s.id = ?"
-        params.append(subject_id)
+    filtered = bool(subject_id)
+    params = [student_id, subject_id, limit] if filtered else [student_id, limit]
     
-    query += " ORDER BY a.id DESC LIMIT ?"
-    params.append(limit)
+    cur.row_factory = None
+    cur.execute(GRADES_WITH_STATS_QUERIES[filtered], params)
+    rows = cur.fetchall()
+    columns = tuple(description[0] for description in cur.description[:-4])
+    grades = [dict(zip(columns, row)) for row in rows]
     
-    cur.execute(query, params)
-    grades = [dict(row) for row in cur.fetchall()]
-    
-    # Calculate statistics
-    if grades:
-        grade_values = [g['grade'] for g in grades]
+    # Statistics come from the window aggregates on each row
+    if rows:
+        average, highest, lowest, count = rows[0][-4:]
         stats = {
-            'average': round(sum(grade_values) / len(grade_values), 2),
-            'highest': max(grade_values),
-            'lowest': min(grade_values),
-            'count': len(grades)
+            'average': round(average, 2),
+            'highest': highest,
+            'lowest': lowest,
+            'count': count
         }
     else:
         stats = {'average': 0, 'highest': 0, 'lowest': 0, 'count': 0}
     
-    conn.close()
-    
-    return jsonify({
+    return json_response({
         'grades': grades,
         'statistics': stats
     })
 
 @api_bp.route('/students/<int:student_id>/attendance', methods=['GET'])
 @require_api_key
+@cached_response
 def get_student_attendance(student_id):
     """Get student's attendance records"""
     days = request.args.get('days', default=30, type=int)
     subject_id = request.args.get('subject_id', type=int)
     
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = _get_conn()
     cur = conn.cursor()
     
-    query = """
-        SELECT att.date, att.present, s.name as subject_name, s.id as subject_id
-        FROM attendance att
-        JOIN subjects s ON att.subject_id = s.id
-        WHERE att.user_id = ?
-        AND att.date >= date('now', '-{} days')
-    """.format(days)
-    
-    params = [student_id]
-    
-    if subject_id:
-        query += " AND s.id = ?"
+    filtered = bool(subject_id)
+    params = [student_id, f'-{days} days']
+    if filtered:
         params.append(subject_id)
     
-    query += " ORDER BY att.date DESC"
+    cur.row_factory = None
+    cur.execute(STUDENT_ATTENDANCE_QUERIES[filtered], params)
+    columns = tuple(description[0] for description in cur.description)
+    attendance_records = [dict(zip(columns, row)) for row in cur.fetchall()]
     
-    cur.execute(query, params)
-    attendance_records = [dict(row) for row in cur.fetchall()]
-    
-    # Calculate attendance rate
-    if attendance_records:
-        present_count = sum(1 for record in attendance_records if record['present'])
-        attendance_rate = (present_count / len(attendance_records)) * 100
+    # Calculate attendance rate over the same filtered rows in SQLite
+    cur.execute(ATTENDANCE_STATS_QUERIES[filtered], params)
+    total_days, present_count = cur.fetchone()
+    if total_days:
+        attendance_rate = (present_count / total_days) * 100
     else:
         attendance_rate = 0
+        present_count = 0
     
-    conn.close()
-    
-    return jsonify({
+    return json_response({
         'attendance_records': attendance_records,
         'statistics': {
             'attendance_rate': round(attendance_rate, 2),
-            'total_days': len(attendance_records),
-            'present_days': sum(1 for record in attendance_records if record['present']),
-            'absent_days': sum(1 for record in attendance_records if not record['present'])
+            'total_days': total_days,
+            'present_days': present_count,
+            'absent_days': total_days - present_count
         }
     })
 
@@ -335,8 +644,7 @@ def get_student_attendance(student_id):
 @require_api_key
 def get_subjects():
     """Get all subjects"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = _get_conn()
     cur = conn.cursor()
     
     cur.execute("""
@@ -349,20 +657,13 @@ def get_subjects():
         ORDER BY s.name
     """)
     
-    subjects = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    
-    return jsonify({
-        'subjects': subjects,
-        'count': len(subjects)
-    })
+    return stream_rows(cur, 'subjects')
 
 @api_bp.route('/subjects/<int:subject_id>/students', methods=['GET'])
 @require_api_key
 def get_subject_students(subject_id):
     """Get students enrolled in a specific subject"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = _get_conn()
     cur = conn.cursor()
     
     cur.execute("""
@@ -377,45 +678,50 @@ def get_subject_students(subject_id):
         ORDER BY u.full_name, u.username
     """, (subject_id, subject_id))
     
-    students = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    
-    return jsonify({
-        'students': students,
-        'count': len(students)
-    })
+    return stream_rows(cur, 'students')
 
 @api_bp.route('/assignments', methods=['POST'])
 @require_api_key
 def create_assignment():
-    """Create a new assignment"""
+    """Create a new assignment, or several from a JSON list in one transaction"""
     data = request.get_json()
+    items = data if isinstance(data, list) else [data]
     
     required_fields = ['name', 'subject_id', 'student_id']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required fields'}), 400
+    if not items or not all(field in item for item in items for field in required_fields):
+        return json_response({'error': 'Missing required fields'}), 400
     
-    conn = sqlite3.connect(DATABASE)
+    conn = _get_conn()
     cur = conn.cursor()
     
     try:
-        cur.execute("""
+        cur.execute("BEGIN")
+        cur.executemany("""
             INSERT INTO assignments (name, subject_id, user_id, grade)
             VALUES (?, ?, ?, ?)
-        """, (data['name'], data['subject_id'], data['student_id'], data.get('grade')))
+        """, [(item['name'], item['subject_id'], item['student_id'], item.get('grade')) for item in items])
         
-        assignment_id = cur.lastrowid
-        conn.commit()
-        
-        return jsonify({
-            'message': 'Assignment created successfully',
-            'assignment_id': assignment_id
-        }), 201
+        # Rowids are allocated consecutively while this transaction holds the write lock
+        last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+        cur.execute("COMMIT")
+        _api_data_changed()
     
     except sqlite3.Error as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+        if conn.in_transaction:
+            cur.execute("ROLLBACK")
+        return json_response({'error': str(e)}), 500
+    
+    if isinstance(data, list):
+        return json_response({
+            'message': 'Assignments created successfully',
+            'assignment_ids': list(range(last_id - len(items) + 1, last_id + 1)),
+            'count': len(items)
+        }), 201
+    
+    return json_response({
+        'message': 'Assignment created successfully',
+        'assignment_id': last_id
+    }), 201
 
 @api_bp.route('/assignments/<int:assignment_id>', methods=['PUT'])
 @require_api_key
@@ -423,7 +729,7 @@ def update_assignment(assignment_id):
     """Update an assignment"""
     data = request.get_json()
     
-    conn = sqlite3.connect(DATABASE)
+    conn = _get_conn()
     cur = conn.cursor()
     
     # Build update query dynamically
@@ -436,7 +742,7 @@ def update_assignment(assignment_id):
             values.append(data[field])
     
     if not update_fields:
-        return jsonify({'error': 'No fields to update'}), 400
+        return json_response({'error': 'No fields to update'}), 400
     
     values.append(assignment_id)
     
@@ -448,15 +754,13 @@ def update_assignment(assignment_id):
         """, values)
         
         if cur.rowcount == 0:
-            return jsonify({'error': 'Assignment not found'}), 404
+            return json_response({'error': 'Assignment not found'}), 404
         
-        conn.commit()
-        return jsonify({'message': 'Assignment updated successfully'})
+        _api_data_changed()
+        return json_response({'message': 'Assignment updated successfully'})
     
     except sqlite3.Error as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+        return json_response({'error': str(e)}), 500
 
 @api_bp.route('/analytics/student/<int:student_id>', methods=['GET'])
 @require_api_key
@@ -468,14 +772,14 @@ def get_student_analytics(student_id):
         prediction = analytics.predict_student_performance(student_id)
         attendance_analysis = analytics.analyze_attendance_patterns(student_id=student_id)
         
-        return jsonify({
+        return json_response({
             'student_id': student_id,
             'performance_prediction': prediction,
             'attendance_analysis': attendance_analysis
         })
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}), 500
 
 @api_bp.route('/api-keys', methods=['POST'])
 @require_api_key
@@ -483,7 +787,7 @@ def create_api_key():
     """Create a new API key (admin only)"""
     # Check if current API key has admin permissions
     if g.api_key_info.get('permissions') != 'all' and 'admin' not in g.api_key_info.get('permissions', ''):
-        return jsonify({'error': 'Admin permissions required'}), 403
+        return json_response({'error': 'Admin permissions required'}), 403
     
     data = request.get_json()
     name = data.get('name', 'Unnamed API Key')
@@ -493,7 +797,7 @@ def create_api_key():
     key_id, secret, key_hash = generate_api_key()
     expires_at = datetime.now() + timedelta(days=expires_days)
     
-    conn = sqlite3.connect(DATABASE)
+    conn = _get_conn()
     cur = conn.cursor()
     
     try:
@@ -501,34 +805,56 @@ def create_api_key():
             INSERT INTO api_keys (key_id, key_hash, user_id, name, permissions, expires_at)
             VALUES (?, ?, ?, ?, ?, ?)
         """, (key_id, key_hash, g.api_key_info['user_id'], name, permissions, expires_at))
+        invalidate_api_key_cache()
         
-        conn.commit()
-        
-        return jsonify({
+        return json_response({
             'message': 'API key created successfully',
             'key_id': key_id,
             'secret': secret,
             'expires_at': expires_at.isoformat(),
+            'token': issue_api_token(key_id, g.api_key_info['user_id'], permissions, expires_at),
             'usage_note': 'Store the secret securely. Use format: Authorization: Bearer key_id:secret'
         }), 201
     
     except sqlite3.Error as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+        return json_response({'error': str(e)}), 500
+
+@api_bp.route('/auth/token', methods=['POST'])
+def issue_token():
+    """Exchange an API key for a short-lived signed token"""
+    auth_header = request.headers.get('Authorization', '')
+    key_id, separator, secret = auth_header[len('Bearer '):].partition(':')
+    
+    # Only a real key can be exchanged, so revoking the key stops new tokens
+    if not auth_header.startswith('Bearer ') or not separator:
+        return json_response({'error': 'Missing or invalid API key format'}), 401
+    
+    api_key_info = verify_api_key(key_id, secret)
+    if not api_key_info:
+        return json_response({'error': 'Invalid or expired API key'}), 401
+    
+    now = datetime.now(timezone.utc)
+    return json_response({
+        'token': issue_api_token(key_id, api_key_info['user_id'], api_key_info['permissions'],
+                                 api_key_info['expires_at']),
+        'token_type': 'Bearer',
+        'expires_in': int((_token_expiry(now, api_key_info['expires_at']) - now).total_seconds())
+    })
 
 # Error handlers
 @api_bp.errorhandler(404)
 def api_not_found(error):
-    return jsonify({'error': 'API endpoint not found'}), 404
+    return json_response({'error': 'API endpoint not found'}), 404
+
+@api_bp.errorhandler(PoolTimeout)
+def api_pool_timeout(error):
+    return json_response({'error': 'Server busy, please retry'}), 503
 
 @api_bp.errorhandler(500)
 def api_internal_error(error):
-    return jsonify({'error': 'Internal server error'}), 500
-
-# Initialize API tables when module is imported
-init_api_tables()
+    return json_response({'error': 'Internal server error'}), 500
 
 def register_api(app):
     """Register API blueprint with Flask app"""
+    init_api_tables()
     app.register_blueprint(api_bp)
\ No newline at end of file
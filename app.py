@@ -1,8 +1,14 @@
-from flask import Flask, render_template, request, redirect, session, url_for
+from flask import Flask, render_template, request, redirect, session, url_for, g
 import sqlite3
 import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime, date
 
+from db_pool import ConnectionPool, PoolTimeout
+
 # Import advanced feature modules with error handling
 try:
     from email_service import EmailService, register_email_routes
@@ -26,7 +32,7 @@ except ImportError as e:
     ANALYTICS_AVAILABLE = False
 
 try:
-    from api_module import register_api
+    from api_module import register_api, on_data_change, invalidate_response_cache
     API_AVAILABLE = True
 except ImportError as e:
     print(f"API module not available: {e}")
@@ -70,11 +76,109 @@ if os.environ.get('VERCEL_DEPLOYMENT'):
 else:
     DATABASE = os.path.join(os.path.dirname(__file__), 'school.db')
 
+# Applied to each pooled connection when it is opened. mmap_size maps up to
+# 256 MiB of the file, far more than school.db needs, so reads of a
+# database below that size come straight from the mapping
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Indexes for the per-user and per-subject lookups the routes and advanced_analytics
+# run. They carry the columns the teacher and analytics aggregates read, so those
+# never touch the table
+APP_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_assignments_user_subject ON assignments(user_id, subject_id, grade)",
+    "CREATE INDEX IF NOT EXISTS idx_assignments_subject_user_grade ON assignments(subject_id, user_id, grade)",
+    # Month of each graded assignment, so the system trend groups straight off the index
+    "CREATE INDEX IF NOT EXISTS idx_assignments_created_month ON assignments("
+    "strftime('%Y-%m', date_created), grade) WHERE grade > 0",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_user_date ON attendance(user_id, date, subject_id, present)",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_subject_date_present ON attendance(subject_id, date, present)",
+    "CREATE INDEX IF NOT EXISTS idx_enrollments_subject_user ON enrollments(subject_id, user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_subjects_teacher ON subjects(teacher_id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)",
+)
+
+# Tables whose writes are counted in table_versions
+VERSIONED_TABLES = ('assignments', 'attendance', 'subjects', 'users')
+
+# Bounded pool of connections shared by the request threads; a request checks one
+# out on its first query and returns it at teardown. An in-memory database lives
+# on the connection that created it, so it gets a pool of one
+DB_POOL_SIZE = 1 if DATABASE == ':memory:' else 8
+# Seconds a request waits for a free connection before it is answered with a 503
+DB_POOL_TIMEOUT = 5
+_pool = ConnectionPool(DATABASE, CONNECTION_PRAGMAS, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+
+# db_transaction blocks in this process take turns instead of polling SQLite's write lock
+_write_lock = threading.Lock()
+
 # --- Helper Functions ---
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Return the current request's pooled connection, checking one out on first use"""
+    if 'db' not in g:
+        g.db = _pool.checkout()
+    return g.db
+
+@app.teardown_appcontext
+def _release_db(error=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        _pool.checkin(conn)
+
+@app.errorhandler(PoolTimeout)
+def _pool_timeout(error):
+    return "Server busy, please retry", 503
+
+@contextmanager
+def db_transaction():
+    """Run a group of writes as one transaction, one writer at a time"""
+    conn = get_db()
+    with _write_lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+# Seconds system settings are served from memory before being re-read
+SETTINGS_CACHE_TTL = 60
+_SETTINGS_CACHE = {}
+
+def get_system_settings():
+    """Return system settings as a dict, re-reading them at most every SETTINGS_CACHE_TTL seconds"""
+    cached = _SETTINGS_CACHE.get('settings')
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT setting_name, setting_value FROM system_settings")
+    settings = dict(cur.fetchall())
+    _SETTINGS_CACHE['settings'] = (time.monotonic() + SETTINGS_CACHE_TTL, settings)
+    return settings
+
+# Seconds a teacher's dashboard stats and reports are served from memory, kept as
+# {teacher_id: {page: (expires, data)}}. This module's routes that change assignments,
+# enrollments or attendance call _data_changed, which also drops the API's cached
+# responses, and API writes clear them all; anything else relies on the TTL
+TEACHER_CACHE_TTL = 60
+_TEACHER_CACHE = {}
+
+def _data_changed(teacher_id=None):
+    """Drop cached teacher pages (only teacher_id's when given) and API responses after a write"""
+    if teacher_id is None:
+        _TEACHER_CACHE.clear()
+    else:
+        _TEACHER_CACHE.pop(teacher_id, None)
+    if API_AVAILABLE:
+        invalidate_response_cache()
 
 def is_admin():
     return session.get('role') == 'admin'
@@ -107,7 +211,7 @@ def login():
         pw = request.form['password']
         conn = get_db()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE username=? AND password=?", (user, pw))
+        cur.execute("SELECT id, role, username FROM users WHERE username=? AND password=?", (user, pw))
         user_row = cur.fetchone()
         if user_row:
             session.clear()
@@ -152,26 +256,22 @@ def system_analytics():
     conn = get_db()
     cur = conn.cursor()
     
-    # Get overall statistics
-    cur.execute("SELECT COUNT(*) FROM users WHERE role='student'")
-    total_students = cur.fetchone()[0]
-    
-    cur.execute("SELECT COUNT(*) FROM users WHERE role='teacher'")
-    total_teachers = cur.fetchone()[0]
-    
-    cur.execute("SELECT COUNT(*) FROM subjects")
-    total_subjects = cur.fetchone()[0]
-    
-    cur.execute("SELECT COUNT(*) FROM assignments")
-    total_assignments = cur.fetchone()[0]
-    
-    # Get average grades
-    cur.execute("SELECT AVG(grade) FROM assignments WHERE grade IS NOT NULL")
-    avg_grade = cur.fetchone()[0] or 0
-    
-    # Get attendance rate
-    cur.execute("SELECT AVG(present) FROM attendance")
-    attendance_rate = (cur.fetchone()[0] or 0) * 100
+    # Get overall statistics, average grade and attendance rate in one query
+    cur.execute("""
+        SELECT (SELECT COUNT(*) FROM users WHERE role='student') as total_students,
+               (SELECT COUNT(*) FROM users WHERE role='teacher') as total_teachers,
+               (SELECT COUNT(*) FROM subjects) as total_subjects,
+               (SELECT COUNT(*) FROM assignments) as total_assignments,
+               (SELECT AVG(grade) FROM assignments WHERE grade IS NOT NULL) as avg_grade,
+               (SELECT AVG(present) FROM attendance) as attendance_rate
+    """)
+    stats = cur.fetchone()
+    total_students = stats['total_students']
+    total_teachers = stats['total_teachers']
+    total_subjects = stats['total_subjects']
+    total_assignments = stats['total_assignments']
+    avg_grade = stats['avg_grade'] or 0
+    attendance_rate = (stats['attendance_rate'] or 0) * 100
     
     # Get subject performance
     cur.execute("""
@@ -205,9 +305,6 @@ def admin_settings():
     
     if request.method == 'POST':
         try:
-            conn = get_db()
-            cur = conn.cursor()
-            
             # Extract form data
             school_name = request.form.get('school_name', 'EduBridge Academy')
             academic_year = request.form.get('academic_year', '2024-2025')
@@ -230,12 +327,11 @@ def admin_settings():
                 ('force_password_change', str(force_password_change))
             ]
             
-            for setting_name, setting_value in settings_data:
-                cur.execute('''INSERT OR REPLACE INTO system_settings 
-                              (setting_name, setting_value) VALUES (?, ?)''', 
-                              (setting_name, setting_value))
-            
-            conn.commit()
+            with db_transaction() as conn:
+                conn.executemany('''INSERT OR REPLACE INTO system_settings 
+                                   (setting_name, setting_value) VALUES (?, ?)''', 
+                                   settings_data)
+            _SETTINGS_CACHE.clear()
             return redirect(url_for('admin_settings'))
             
         except Exception as e:
@@ -243,10 +339,7 @@ def admin_settings():
             return redirect(url_for('admin_settings'))
     
     # Load current settings
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT setting_name, setting_value FROM system_settings")
-    settings = dict(cur.fetchall())
+    settings = get_system_settings()
     
     return render_template('admin_settings.html', settings=settings)
 
@@ -272,16 +365,14 @@ def system_settings():
                            'force_password_change', str(force_password_change)))
             
             conn.commit()
+            _SETTINGS_CACHE.clear()
             return redirect(url_for('system_settings'))
             
         except Exception as e:
             return redirect(url_for('system_settings'))
     
     # Load current settings
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT setting_name, setting_value FROM system_settings")
-    settings = dict(cur.fetchall())
+    settings = get_system_settings()
     
     return render_template('admin_settings.html', settings=settings)
 
@@ -292,7 +383,6 @@ def manage_users():
         return redirect(url_for('login'))
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM users")
     
     if request.method == 'POST':
         username = request.form['username']
@@ -303,7 +393,7 @@ def manage_users():
         conn.commit()
     
     # Get all users
-    cur.execute("SELECT * FROM users")
+    cur.execute("SELECT id, username, role FROM users")
     users = cur.fetchall()
     
     # Get all subjects
@@ -328,12 +418,9 @@ def delete_user():
     user_id = request.form['user_id']
     conn = get_db()
     cur = conn.cursor()
+    # The delete_user_rows trigger removes the user's assignments, enrollments, attendance and schedule
     cur.execute("DELETE FROM users WHERE id=?", (user_id,))
-    cur.execute("DELETE FROM assignments WHERE user_id=?", (user_id,))
-    cur.execute("DELETE FROM enrollments WHERE user_id=?", (user_id,))
-    cur.execute("DELETE FROM schedule WHERE user_id=?", (user_id,))
-    cur.execute("DELETE FROM attendance WHERE user_id=?", (user_id,))
-    conn.commit()
+    _data_changed()
     return redirect(url_for('manage_users'))
 
 @app.route('/manage_subjects', methods=['GET','POST'])
@@ -364,14 +451,13 @@ def delete_subject():
         return redirect(url_for('login'))
     
     subject_id = request.form['subject_id']
+    
     conn = get_db()
     cur = conn.cursor()
     
-    # Proceed with deletion
+    # Proceed with deletion; the delete_subject_rows trigger removes its assignments and enrollments
     cur.execute("DELETE FROM subjects WHERE id=?", (subject_id,))
-    cur.execute("DELETE FROM assignments WHERE subject_id=?", (subject_id,))
-    cur.execute("DELETE FROM enrollments WHERE subject_id=?", (subject_id,))
-    conn.commit()
+    _data_changed()
     return redirect(url_for('manage_subjects'))
 
 @app.route('/manage_assignments', methods=['GET','POST'])
@@ -382,15 +468,6 @@ def manage_assignments():
     cur = conn.cursor()
     user_id = session['user_id']
 
-    if is_admin():
-        # Admin can see all subjects
-        cur.execute("SELECT * FROM subjects")
-        subjects = cur.fetchall()
-    else:
-        # Teachers can only see their subjects
-        cur.execute("SELECT * FROM subjects WHERE teacher_id = ?", (user_id,))
-        subjects = cur.fetchall()
-
     if request.method == 'POST':
         action = request.form.get('action')
         if action == 'delete':
@@ -403,6 +480,7 @@ def manage_assignments():
                               (SELECT id FROM subjects WHERE teacher_id = ?)''',
                               (assignment_id, user_id))
             conn.commit()
+            _data_changed()
         else:
             subject_id = request.form['subject_id']
             assignment_name = request.form['assignment_name']
@@ -422,33 +500,23 @@ def manage_assignments():
                 cur.execute("INSERT INTO assignments (name, subject_id, user_id) VALUES (?,?,?)",
                             (assignment_name, subject_id, session['user_id']))
             conn.commit()
+            _data_changed()
 
-    # Get assignments
+    # Get assignments; the page lists only these, with their subject names
     if is_admin():
         cur.execute('''SELECT assignments.*, subjects.name AS subject_name
                        FROM assignments
-                       JOIN subjects ON assignments.subject_id = subjects.id''')
+                       JOIN subjects ON assignments.subject_id = subjects.id
+                       ORDER BY assignments.id''')
     else:
         cur.execute('''SELECT assignments.*, subjects.name AS subject_name
                        FROM assignments
                        JOIN subjects ON assignments.subject_id = subjects.id
-                       WHERE subjects.teacher_id = ?''', (user_id,))
+                       WHERE subjects.teacher_id = ?
+                       ORDER BY assignments.id''', (user_id,))
     assignments = cur.fetchall()
 
-    # Get students
-    if is_admin():
-        cur.execute("SELECT * FROM users WHERE role='student'")
-    else:
-        cur.execute('''SELECT DISTINCT users.*
-                       FROM users
-                       JOIN enrollments ON users.id = enrollments.user_id
-                       JOIN subjects ON enrollments.subject_id = subjects.id
-                       WHERE subjects.teacher_id = ? AND users.role = 'student' ''', (user_id,))
-    students = cur.fetchall()
-
     return render_template('manage_assignments.html', 
-                         subjects=subjects, 
-                         students=students, 
                          assignments=assignments)
 
 @app.route('/delete_assignment', methods=['POST'])
@@ -463,6 +531,7 @@ def delete_assignment():
     # Proceed with deletion
     cur.execute("DELETE FROM assignments WHERE id=?", (assignment_id,))
     conn.commit()
+    _data_changed()
     return redirect(url_for('manage_assignments'))
 
 @app.route('/edit_grade', methods=['POST'])
@@ -478,6 +547,7 @@ def edit_grade():
     # Proceed with grade update
     cur.execute("UPDATE assignments SET grade=? WHERE id=?", (grade, assignment_id))
     conn.commit()
+    _data_changed()
     return redirect(url_for('manage_assignments'))
 
 # --- Student Progress and Attendance ---
@@ -490,10 +560,12 @@ def student_progress():
     conn = get_db()
     cur = conn.cursor()
 
-    # Get student's subjects and grades
+    # Get student's subjects and grades, plus the overall grade across subjects
+    # (subjects without grades count as 0). The rows go to the template as they are.
     cur.execute('''SELECT subjects.name as subject,
-                          users.username as teacher_name,
-                          AVG(assignments.grade) as avg_grade
+                          users.username as teacher,
+                          COALESCE(AVG(assignments.grade), 0) as avg_grade,
+                          AVG(COALESCE(AVG(assignments.grade), 0)) OVER () as overall_grade
                    FROM enrollments
                    JOIN subjects ON enrollments.subject_id = subjects.id
                    LEFT JOIN users ON subjects.teacher_id = users.id
@@ -501,28 +573,17 @@ def student_progress():
                    AND assignments.user_id = ?
                    WHERE enrollments.user_id = ?
                    GROUP BY subjects.id''', (user_id, user_id))
+    subjects = cur.fetchall()
     
-    subjects = []
-    total_grade = 0
-    total_subjects = 0
-    
-    for s in cur.fetchall():
-        avg_grade = s['avg_grade'] if s['avg_grade'] else 0
-        total_grade += avg_grade
-        total_subjects += 1
-        
-        subjects.append({
-            'subject': s['subject'],
-            'teacher': s['teacher_name'],
-            'avg_grade': avg_grade
-        })
-    
-    overall_grade = total_grade / total_subjects if total_subjects > 0 else 0
+    overall_grade = subjects[0]['overall_grade'] if subjects else 0
     
     return render_template('student_progress.html',
                          subjects=subjects,
                          overall_grade=overall_grade)
 
+# Attendance history rows shown per page on the student attendance page
+ATTENDANCE_PAGE_SIZE = 50
+
 @app.route('/student_attendance')
 def student_attendance():
     if not is_student():
@@ -532,29 +593,54 @@ def student_attendance():
     conn = get_db()
     cur = conn.cursor()
     
-    # Get attendance records
-    cur.execute('''SELECT subjects.name as subject_name,
-                          attendance.date,
-                          attendance.present
-                   FROM attendance
-                   JOIN subjects ON attendance.subject_id = subjects.id
-                   WHERE attendance.user_id = ?
-                   ORDER BY attendance.date DESC''', (user_id,))
+    # Get one page of attendance records, newest first. Older pages start after the
+    # date and id of the last record shown, so no rows are skipped over with OFFSET
+    before_date = request.args.get('before_date')
+    before_id = request.args.get('before_id', type=int)
+    if before_date and before_id:
+        cur.execute('''SELECT attendance.id,
+                              subjects.name as subject_name,
+                              attendance.date,
+                              attendance.present
+                       FROM attendance
+                       JOIN subjects ON attendance.subject_id = subjects.id
+                       WHERE attendance.user_id = ?
+                       AND (attendance.date, attendance.id) < (?, ?)
+                       ORDER BY attendance.date DESC, attendance.id DESC
+                       LIMIT ?''', (user_id, before_date, before_id, ATTENDANCE_PAGE_SIZE + 1))
+    else:
+        cur.execute('''SELECT attendance.id,
+                              subjects.name as subject_name,
+                              attendance.date,
+                              attendance.present
+                       FROM attendance
+                       JOIN subjects ON attendance.subject_id = subjects.id
+                       WHERE attendance.user_id = ?
+                       ORDER BY attendance.date DESC, attendance.id DESC
+                       LIMIT ?''', (user_id, ATTENDANCE_PAGE_SIZE + 1))
     attendance_records = cur.fetchall()
     
-    # Get attendance statistics by subject
+    # The extra row only tells us whether there is an older page
+    older_page = None
+    if len(attendance_records) > ATTENDANCE_PAGE_SIZE:
+        attendance_records = attendance_records[:ATTENDANCE_PAGE_SIZE]
+        last = attendance_records[-1]
+        older_page = url_for('student_attendance', before_date=last['date'], before_id=last['id'])
+    
+    # Get attendance statistics by subject from the running totals
     cur.execute('''SELECT subjects.name as subject_name,
-                          COUNT(*) as total_classes,
-                          SUM(present) as classes_present,
-                          ROUND(AVG(CAST(present AS FLOAT)) * 100, 1) as attendance_rate
-                   FROM attendance
-                   JOIN subjects ON attendance.subject_id = subjects.id
-                   WHERE attendance.user_id = ?
-                   GROUP BY subjects.id, subjects.name''', (user_id,))
+                          attendance_summary.total as total_classes,
+                          attendance_summary.present as classes_present,
+                          ROUND(CAST(attendance_summary.present AS FLOAT) / attendance_summary.total * 100, 1) as attendance_rate
+                   FROM attendance_summary
+                   JOIN subjects ON attendance_summary.subject_id = subjects.id
+                   WHERE attendance_summary.user_id = ? AND attendance_summary.total > 0
+                   ORDER BY subjects.id''', (user_id,))
     subject_attendance = cur.fetchall()
     
     return render_template('student_attendance.html',
                          attendance_records=attendance_records,
+                         older_page=older_page,
                          subject_attendance=subject_attendance)
 
 # --- Student Dashboard ---
@@ -567,88 +653,62 @@ def student_dashboard():
     conn = get_db()
     cur = conn.cursor()
 
-    # Get subjects the student is enrolled in
+    # Get subjects the student is enrolled in, with the average grade for completed assignments
     cur.execute('''SELECT DISTINCT 
                 subjects.id, 
                 subjects.name,
-                users.username as teacher_name
+                users.username as teacher_name,
+                graded.avg_grade
                 FROM subjects
                 JOIN enrollments ON subjects.id = enrollments.subject_id
                 LEFT JOIN users ON subjects.teacher_id = users.id
-                WHERE enrollments.user_id = ?''', (user_id,))
+                LEFT JOIN (SELECT subject_id, AVG(grade) as avg_grade
+                           FROM assignments
+                           WHERE user_id = ? AND grade > 0
+                           GROUP BY subject_id) graded ON graded.subject_id = subjects.id
+                WHERE enrollments.user_id = ?''', (user_id, user_id))
     subjects = cur.fetchall()
 
+    # Get all assignments for those subjects in one query and group them by subject
+    cur.execute('''SELECT subject_id, name, grade 
+                  FROM assignments 
+                  WHERE subject_id IN (SELECT subject_id FROM enrollments WHERE user_id = ?) 
+                  AND (user_id = ? OR user_id IN 
+                      (SELECT id FROM users WHERE role = 'teacher'))
+                  ORDER BY id''', 
+                  (user_id, user_id))
+    assignments_by_subject = defaultdict(list)
+    for a in cur:
+        assignments_by_subject[a['subject_id']].append(a)
+
     subject_grades = []
     for s in subjects:
-        # Get average grade for completed assignments
-        cur.execute('''SELECT AVG(grade) as avg_grade 
-                      FROM assignments 
-                      WHERE user_id = ? 
-                      AND subject_id = ? 
-                      AND grade > 0''', (user_id, s['id']))
-        avg_grade = cur.fetchone()['avg_grade'] or 0
-        
-        # Get all assignments for this subject
-        cur.execute('''SELECT name, grade 
-                      FROM assignments 
-                      WHERE subject_id = ? 
-                      AND (user_id = ? OR user_id IN 
-                          (SELECT id FROM users WHERE role = 'teacher'))''', 
-                      (s['id'], user_id))
-        assignments = cur.fetchall()
-        
         subject_grades.append({
             'subject': s['name'],
             'id': s['id'],
             'teacher': s['teacher_name'],
-            'avg_grade': avg_grade,
-            'assignments': assignments
+            'avg_grade': s['avg_grade'] or 0,
+            'assignments': assignments_by_subject.get(s['id'], [])
         })
 
-    # Create schedule table if it doesn't exist
-    cur.execute('''CREATE TABLE IF NOT EXISTS schedule (
-        id INTEGER PRIMARY KEY,
-        user_id INTEGER,
-        subject_id INTEGER,
-        day TEXT,
-        period INTEGER,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (subject_id) REFERENCES subjects(id)
-    )''')
-    conn.commit()
-
     # Get student's schedule
     cur.execute('''SELECT subjects.name, schedule.day, schedule.period 
                    FROM schedule
                    JOIN subjects ON schedule.subject_id = subjects.id
                    WHERE schedule.user_id = ?
-                   ORDER BY 
-                     CASE schedule.day
-                       WHEN 'Monday' THEN 1
-                       WHEN 'Tuesday' THEN 2
-                       WHEN 'Wednesday' THEN 3
-                       WHEN 'Thursday' THEN 4
-                       WHEN 'Friday' THEN 5
-                     END,
-                     schedule.period''', (user_id,))
+                   ORDER BY schedule.day_index, schedule.period''', (user_id,))
     schedule = cur.fetchall()
 
-    # Get student's attendance
+    # Get student's attendance rate per subject, already rounded
     cur.execute('''SELECT 
                    subjects.name,
-                   COUNT(CASE WHEN present = 1 THEN 1 END) as present_count,
-                   COUNT(*) as total_count
+                   ROUND(100.0 * COUNT(CASE WHEN present = 1 THEN 1 END) / COUNT(*), 1) as attendance_rate
                    FROM attendance
                    JOIN subjects ON attendance.subject_id = subjects.id
                    WHERE attendance.user_id = ?
                    AND date >= date('now', '-30 days')
                    GROUP BY subjects.id''', (user_id,))
-    attendance = cur.fetchall()
-
-    attendance_stats = {}
-    for a in attendance:
-        attendance_rate = (a['present_count'] / a['total_count'] * 100) if a['total_count'] > 0 else 100
-        attendance_stats[a['name']] = round(attendance_rate, 1)
+    attendance_stats = dict(cur.fetchall())
 
     return render_template('student_dashboard.html',
                          username=username,
@@ -668,7 +728,7 @@ def subject(subject_id):
     sub = cur.fetchone()
     if not sub:
         return "Subject not found", 404
-    cur.execute("SELECT name, grade FROM assignments WHERE subject_id=? AND user_id=?", (subject_id, user_id))
+    cur.execute("SELECT name, grade FROM assignments WHERE subject_id=? AND user_id=? ORDER BY id", (subject_id, user_id))
     assignments = cur.fetchall()
     return render_template('subject.html', subject=sub['name'], assignments=assignments)
 
@@ -682,26 +742,39 @@ def teacher_analytics():
     conn = get_db()
     cur = conn.cursor()
 
-    # Get overall analytics
-    cur.execute('''SELECT AVG(assignments.grade) as overall_avg,
-                          COUNT(DISTINCT assignments.id) as total_assignments,
-                          COUNT(DISTINCT enrollments.user_id) as total_students
-                   FROM assignments
-                   JOIN subjects ON assignments.subject_id = subjects.id
-                   JOIN enrollments ON enrollments.subject_id = subjects.id
-                   WHERE subjects.teacher_id = ?''', (user_id,))
+    # Get overall analytics and the 30-day attendance rate in one query. Grades are
+    # averaged as if joined to each enrollment in their subject, with per-subject
+    # totals standing in for the assignment x enrollment join
+    cur.execute('''WITH my_subjects AS (SELECT id FROM subjects WHERE teacher_id = ?),
+                   enrolled AS (SELECT subject_id, COUNT(*) as students
+                                FROM enrollments
+                                WHERE subject_id IN my_subjects
+                                GROUP BY subject_id),
+                   graded AS (SELECT subject_id,
+                                     TOTAL(grade) as grade_sum,
+                                     COUNT(grade) as grade_count,
+                                     COUNT(*) as assignment_count
+                              FROM assignments
+                              WHERE subject_id IN my_subjects
+                              GROUP BY subject_id)
+                   SELECT SUM(graded.grade_sum * enrolled.students)
+                              / SUM(graded.grade_count * enrolled.students) as overall_avg,
+                          COALESCE(SUM(graded.assignment_count), 0) as total_assignments,
+                          (SELECT COUNT(DISTINCT user_id)
+                           FROM enrollments
+                           WHERE subject_id IN (SELECT subject_id FROM graded)) as total_students,
+                          (SELECT AVG(CAST(present AS FLOAT))*100
+                           FROM attendance
+                           WHERE subject_id IN my_subjects
+                           AND date >= date('now', '-30 days')) as attendance_rate
+                   FROM graded
+                   JOIN enrolled ON enrolled.subject_id = graded.subject_id''', (user_id,))
     stats = cur.fetchone()
     
     overall_average = stats['overall_avg'] if stats['overall_avg'] else 0
     total_assignments = stats['total_assignments']
     total_students = stats['total_students']
-    
-    # Get attendance statistics
-    cur.execute('''SELECT AVG(CAST(present AS FLOAT))*100 as attendance_rate
-                   FROM attendance
-                   WHERE subject_id IN (SELECT id FROM subjects WHERE teacher_id = ?)
-                   AND date >= date('now', '-30 days')''', (user_id,))
-    attendance_rate = cur.fetchone()['attendance_rate'] or 100
+    attendance_rate = stats['attendance_rate'] or 100
     
     return render_template('teacher_analytics.html',
                          overall_average=round(overall_average, 1),
@@ -725,51 +798,44 @@ def teacher_dashboard():
                    WHERE assignments.user_id=? OR subjects.teacher_id=?''', (user_id, user_id))
     my_classes = cur.fetchall()
 
-    # Stats - Get total number of students in teacher's subjects
-    cur.execute('''SELECT COUNT(DISTINCT enrollments.user_id) as student_count
-                   FROM enrollments
-                   JOIN subjects ON enrollments.subject_id = subjects.id
-                   WHERE subjects.teacher_id = ?''', (user_id,))
-    students_count = cur.fetchone()['student_count'] or 0
-
-    # Get active assignments (assignments with no grades yet)
-    cur.execute('''SELECT COUNT(*) as active_assignments 
-                   FROM assignments 
-                   JOIN subjects ON assignments.subject_id = subjects.id
-                   WHERE subjects.teacher_id = ? AND (grade IS NULL OR grade = 0)''', (user_id,))
-    active_assignments = cur.fetchone()['active_assignments'] or 0
-
-    # Ensure attendance table exists
-    cur.execute('''CREATE TABLE IF NOT EXISTS attendance (
-                        id INTEGER PRIMARY KEY,
-                        user_id INTEGER,
-                        subject_id INTEGER,
-                        date TEXT,
-                        present INTEGER
-                   )''')
-    conn.commit()
-
-    # Calculate attendance rate for the current week
-    cur.execute('''SELECT AVG(CAST(present AS FLOAT))*100 as attendance_rate
-                   FROM attendance
-                   WHERE subject_id IN (SELECT id FROM subjects WHERE teacher_id = ?)
-                   AND date >= date('now', '-7 days')''', (user_id,))
-    row = cur.fetchone()
-    attendance_rate = round(row['attendance_rate'] if row['attendance_rate'] is not None else 100, 1)
-
-    # Calculate average grade across all assignments in teacher's subjects
-    cur.execute('''SELECT AVG(CAST(assignments.grade AS FLOAT)) as avg_grade
-                   FROM assignments
-                   JOIN subjects ON assignments.subject_id = subjects.id
-                   WHERE subjects.teacher_id = ? AND assignments.grade > 0''', (user_id,))
-    average_grade = round(cur.fetchone()['avg_grade'] or 0, 1)
-
-    cur.execute('''SELECT assignments.name, subjects.name as subject_name
-                   FROM assignments
-                   JOIN subjects ON assignments.subject_id = subjects.id
-                   WHERE assignments.user_id=?
-                   ORDER BY assignments.id DESC LIMIT 5''', (user_id,))
-    recent_activity = [f"Assignment '{r['name']}' in {r['subject_name']}" for r in cur.fetchall()]
+    # Stats - students in teacher's subjects, active (ungraded) assignments,
+    # attendance rate for the current week and average grade, in one query that is
+    # kept for TEACHER_CACHE_TTL seconds
+    cached = _TEACHER_CACHE.get(user_id, {}).get('dashboard')
+    if cached and cached[0] > time.monotonic():
+        stats = cached[1]
+    else:
+        cur.execute('''WITH my_subjects AS (SELECT id FROM subjects WHERE teacher_id = ?)
+                       SELECT (SELECT COUNT(DISTINCT user_id)
+                               FROM enrollments
+                               WHERE subject_id IN my_subjects) as student_count,
+                              (SELECT COUNT(*)
+                               FROM assignments
+                               WHERE subject_id IN my_subjects
+                               AND (grade IS NULL OR grade = 0)) as active_assignments,
+                              (SELECT AVG(CAST(present AS FLOAT))*100
+                               FROM attendance
+                               WHERE subject_id IN my_subjects
+                               AND date >= date('now', '-7 days')) as attendance_rate,
+                              (SELECT AVG(CAST(grade AS FLOAT))
+                               FROM assignments
+                               WHERE subject_id IN my_subjects
+                               AND grade > 0) as avg_grade''', (user_id,))
+        stats = dict(cur.fetchone())
+
+        # The teacher's five newest assignments are cached with the stats
+        cur.execute('''SELECT assignments.name, subjects.name as subject_name
+                       FROM assignments
+                       JOIN subjects ON assignments.subject_id = subjects.id
+                       WHERE assignments.user_id=?
+                       ORDER BY assignments.id DESC LIMIT 5''', (user_id,))
+        stats['recent_activity'] = [f"Assignment '{r['name']}' in {r['subject_name']}" for r in cur.fetchall()]
+        _TEACHER_CACHE.setdefault(user_id, {})['dashboard'] = (time.monotonic() + TEACHER_CACHE_TTL, stats)
+    students_count = stats['student_count'] or 0
+    active_assignments = stats['active_assignments'] or 0
+    attendance_rate = round(stats['attendance_rate'] if stats['attendance_rate'] is not None else 100, 1)
+    average_grade = round(stats['avg_grade'] or 0, 1)
+    recent_activity = stats['recent_activity']
 
     # Get unread message count
     from parent_portal import parent_portal
@@ -805,6 +871,7 @@ def add_assignment():
         cur.execute("INSERT INTO assignments (name, grade, subject_id, user_id) VALUES (?, ?, ?, ?)",
                     (assignment_name, 0, subject_id, user_id))
         conn.commit()
+        _data_changed(user_id)
         return redirect(url_for('add_assignment'))
 
     return render_template('add_assignment.html', my_classes=my_classes)
@@ -823,26 +890,25 @@ def enter_grades():
     cur.execute('''SELECT id, name FROM subjects WHERE teacher_id = ?''', (user_id,))
     subjects = cur.fetchall()
 
-    # Get all students and their assignments for each subject
-    students_assignments = []
-    for subject in subjects:
-        cur.execute('''SELECT 
-                        users.id as student_id,
-                        users.username as student_name,
-                        assignments.id as assignment_id,
-                        assignments.name as assignment_name,
-                        assignments.grade,
-                        subjects.name as subject_name
-                    FROM users
-                    JOIN enrollments ON users.id = enrollments.user_id
-                    JOIN subjects ON enrollments.subject_id = subjects.id
-                    LEFT JOIN assignments ON (
-                        assignments.subject_id = subjects.id 
-                        AND assignments.user_id = users.id
-                    )
-                    WHERE subjects.id = ? AND users.role = 'student'
-                    ORDER BY users.username, assignments.name''', (subject['id'],))
-        students_assignments.extend(cur.fetchall())
+    # Get all students and their assignments across the teacher's subjects
+    cur.execute('''SELECT 
+                    users.id as student_id,
+                    users.username as student_name,
+                    assignments.id as assignment_id,
+                    assignments.name as assignment_name,
+                    assignments.grade,
+                    subjects.name as subject_name
+                FROM users
+                JOIN enrollments ON users.id = enrollments.user_id
+                JOIN subjects ON enrollments.subject_id = subjects.id
+                LEFT JOIN assignments ON (
+                    assignments.subject_id = subjects.id 
+                    AND assignments.user_id = users.id
+                )
+                WHERE subjects.teacher_id = ? AND users.role = 'student'
+                ORDER BY subjects.id, users.username, assignments.name''', (user_id,))
+    # The template filters this list once per subject, so hand it plain dicts
+    students_assignments = [dict(r) for r in cur.fetchall()]
 
     if request.method == 'POST':
         student_id = request.form['student_id']
@@ -861,6 +927,7 @@ def enter_grades():
                           VALUES (?, ?, ?, ?)''', 
                           (assignment_name, grade, subject_id, student_id))
         conn.commit()
+        _data_changed(user_id)
         return redirect(url_for('enter_grades'))
 
     return render_template('enter_grades.html', 
@@ -876,16 +943,6 @@ def mark_attendance():
     conn = get_db()
     cur = conn.cursor()
 
-    # Create attendance table if it doesn't exist
-    cur.execute('''CREATE TABLE IF NOT EXISTS attendance (
-                        id INTEGER PRIMARY KEY,
-                        user_id INTEGER,
-                        subject_id INTEGER,
-                        date TEXT,
-                        present INTEGER
-                   )''')
-    conn.commit()
-
     # Get teacher's subjects
     cur.execute('''SELECT id, name FROM subjects WHERE teacher_id = ?''', (user_id,))
     subjects = cur.fetchall()
@@ -924,19 +981,18 @@ def mark_attendance():
         subject_id = request.form['subject_id']
         date = request.form['date']
         
-        # First delete any existing attendance records for this date and subject
-        cur.execute('''DELETE FROM attendance 
-                      WHERE subject_id = ? AND date = ?''', (subject_id, date))
-        
-        # Insert new attendance records
-        for key, value in request.form.items():
-            if key.startswith('student_'):
-                student_id = key.split('_')[1]
-                present = 1 if value == 'present' else 0
-                cur.execute('''INSERT INTO attendance (user_id, subject_id, date, present)
-                              VALUES (?, ?, ?, ?)''', (student_id, subject_id, date, present))
+        with db_transaction():
+            # First delete any existing attendance records for this date and subject
+            cur.execute('''DELETE FROM attendance 
+                          WHERE subject_id = ? AND date = ?''', (subject_id, date))
+            
+            # Insert new attendance records
+            rows = [(key.split('_')[1], subject_id, date, 1 if value == 'present' else 0)
+                    for key, value in request.form.items() if key.startswith('student_')]
+            cur.executemany('''INSERT INTO attendance (user_id, subject_id, date, present)
+                              VALUES (?, ?, ?, ?)''', rows)
+        _data_changed(user_id)
         
-        conn.commit()
         return redirect(url_for('mark_attendance', subject_id=subject_id, date=date))
 
     return render_template('mark_attendance.html',
@@ -968,6 +1024,7 @@ def enroll_student():
             cur.execute("INSERT INTO enrollments (user_id, subject_id) VALUES (?, ?)", 
                        (student_id, subject_id))
             conn.commit()
+            _data_changed()
         except sqlite3.IntegrityError:
             pass  # Student is already enrolled
         
@@ -1011,16 +1068,6 @@ def teacher_settings():
     cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     current_user = cur.fetchone()
 
-    # Create settings table if it doesn't exist
-    cur.execute('''CREATE TABLE IF NOT EXISTS user_settings (
-        user_id INTEGER PRIMARY KEY,
-        email_notifications BOOLEAN DEFAULT 0,
-        assignment_reminders BOOLEAN DEFAULT 0,
-        attendance_reminders BOOLEAN DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )''')
-    conn.commit()
-
     # Get or create user settings
     cur.execute("SELECT * FROM user_settings WHERE user_id = ?", (user_id,))
     settings = cur.fetchone()
@@ -1056,37 +1103,30 @@ def teacher_settings():
         assignment_reminders = 1 if request.form.get('assignment_reminders') else 0
         attendance_reminders = 1 if request.form.get('attendance_reminders') else 0
 
-        cur.execute('''INSERT OR REPLACE INTO user_settings 
+        # Update in place so columns this form doesn't manage keep their values
+        cur.execute('''INSERT INTO user_settings 
                       (user_id, email_notifications, assignment_reminders, attendance_reminders)
-                      VALUES (?, ?, ?, ?)''',
+                      VALUES (?, ?, ?, ?)
+                      ON CONFLICT(user_id) DO UPDATE SET
+                      email_notifications = excluded.email_notifications,
+                      assignment_reminders = excluded.assignment_reminders,
+                      attendance_reminders = excluded.attendance_reminders''',
                    (user_id, email_notifications, assignment_reminders, attendance_reminders))
         
         conn.commit()
         if not error:
             success = "Settings updated successfully"
 
-        # Refresh settings after update
-        cur.execute("SELECT * FROM user_settings WHERE user_id = ?", (user_id,))
-        settings = cur.fetchone()
+        # The template only reads the values just written
+        settings = {'email_notifications': email_notifications,
+                    'assignment_reminders': assignment_reminders,
+                    'attendance_reminders': attendance_reminders}
 
     return render_template('teacher_settings.html',
                          current_user=current_user,
                          settings=settings,
                          error=error,
                          success=success)
-    cur = conn.cursor()
-    if request.method == 'POST':
-        new_username = request.form['username']
-        new_password = request.form['password']
-        if new_password:
-            cur.execute("UPDATE users SET username=?, password=? WHERE id=?", (new_username, new_password, user_id))
-        else:
-            cur.execute("UPDATE users SET username=? WHERE id=?", (new_username, user_id))
-        conn.commit()
-        return redirect(url_for('teacher_settings'))
-    cur.execute("SELECT username FROM users WHERE id=?", (user_id,))
-    username = cur.fetchone()['username']
-    return render_template('teacher_settings.html', username=username)
 
 # --- Teacher Reports ---
 @app.route('/teacher_reports')
@@ -1094,39 +1134,53 @@ def teacher_reports():
     if not is_teacher():
         return redirect(url_for('login'))
     user_id = session['user_id']
-    conn = get_db()
-    cur = conn.cursor()
-
-    cur.execute('''SELECT COUNT(DISTINCT enrollments.user_id) AS total_students
-                   FROM enrollments
-                   JOIN assignments ON enrollments.subject_id = assignments.subject_id
-                   WHERE assignments.user_id=?''', (user_id,))
-    total_students = cur.fetchone()['total_students'] or 0
-
-    cur.execute("SELECT COUNT(*) AS total_assignments FROM assignments WHERE user_id=?", (user_id,))
-    total_assignments = cur.fetchone()['total_assignments'] or 0
 
-    cur.execute("SELECT AVG(grade) AS avg_grade FROM assignments WHERE user_id=?", (user_id,))
-    average_grade = cur.fetchone()['avg_grade'] or 0
-
-    cur.execute('''SELECT subjects.id, subjects.name,
-                          COUNT(DISTINCT enrollments.user_id) AS student_count,
-                          COUNT(assignments.id) AS assignment_count,
-                          AVG(assignments.grade) AS average_grade
-                   FROM subjects
-                   LEFT JOIN enrollments ON subjects.id = enrollments.subject_id
-                   LEFT JOIN assignments ON subjects.id = assignments.subject_id AND assignments.user_id=?
-                   WHERE subjects.id IN (SELECT DISTINCT assignments.subject_id FROM assignments WHERE assignments.user_id=?)
-                   GROUP BY subjects.id''', (user_id, user_id))
-    class_reports = cur.fetchall()
+    # Reports are kept for TEACHER_CACHE_TTL seconds
+    cached = _TEACHER_CACHE.get(user_id, {}).get('reports')
+    if cached and cached[0] > time.monotonic():
+        report = cached[1]
+    else:
+        conn = get_db()
+        cur = conn.cursor()
 
-    return render_template('teacher_reports.html',
-                           total_students=total_students,
-                           total_assignments=total_assignments,
-                           average_grade=average_grade,
-                           class_reports=class_reports)
+        # The teacher's classes are the subjects they have created assignments in
+        cur.execute('''WITH taught_subjects AS (SELECT DISTINCT subject_id FROM assignments WHERE user_id=?)
+                       SELECT (SELECT COUNT(DISTINCT user_id)
+                               FROM enrollments
+                               WHERE subject_id IN taught_subjects) AS total_students,
+                              COUNT(*) AS total_assignments,
+                              AVG(grade) AS avg_grade
+                       FROM assignments
+                       WHERE user_id=?''', (user_id, user_id))
+        totals = cur.fetchone()
+        total_students = totals['total_students'] or 0
+        total_assignments = totals['total_assignments'] or 0
+        average_grade = totals['avg_grade'] or 0
+
+        cur.execute('''WITH taught_subjects AS (SELECT DISTINCT subject_id FROM assignments WHERE user_id=?)
+                       SELECT subjects.id, subjects.name,
+                              COUNT(DISTINCT enrollments.user_id) AS student_count,
+                              COUNT(assignments.id) AS assignment_count,
+                              AVG(assignments.grade) AS average_grade
+                       FROM subjects
+                       LEFT JOIN enrollments ON subjects.id = enrollments.subject_id
+                       LEFT JOIN assignments ON subjects.id = assignments.subject_id AND assignments.user_id=?
+                       WHERE subjects.id IN taught_subjects
+                       GROUP BY subjects.id''', (user_id, user_id))
+        class_reports = cur.fetchall()
+        report = {'total_students': total_students,
+                  'total_assignments': total_assignments,
+                  'average_grade': average_grade,
+                  'class_reports': class_reports}
+        _TEACHER_CACHE.setdefault(user_id, {})['reports'] = (time.monotonic() + TEACHER_CACHE_TTL, report)
+
+    return render_template('teacher_reports.html', **report)
 
 # --- Manage Schedule ---
+# School days and the 8 periods in each, as shown on the schedule pages
+SCHOOL_DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday')
+PERIODS = tuple(range(1, 9))
+
 @app.route('/manage_schedule', methods=['GET', 'POST'])
 def manage_schedule():
     if not (is_admin() or is_teacher()):
@@ -1136,18 +1190,6 @@ def manage_schedule():
     conn = get_db()
     cur = conn.cursor()
 
-    # Create schedule table if it doesn't exist
-    cur.execute('''CREATE TABLE IF NOT EXISTS schedule (
-        id INTEGER PRIMARY KEY,
-        user_id INTEGER,
-        subject_id INTEGER,
-        day TEXT,
-        period INTEGER,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (subject_id) REFERENCES subjects(id)
-    )''')
-    conn.commit()
-
     # Get teacher's subjects
     cur.execute('''SELECT id, name FROM subjects WHERE teacher_id = ?''', (user_id,))
     subjects = cur.fetchall()
@@ -1158,7 +1200,7 @@ def manage_schedule():
             if 'schedule_id' in request.form:  # For schedule deletion
                 schedule_id = request.form['schedule_id']
                 cur.execute('''DELETE FROM schedule 
-                              WHERE id = ? AND subject_id IN 
+                              WHERE rowid = ? AND subject_id IN 
                               (SELECT id FROM subjects WHERE teacher_id = ?)''', 
                               (schedule_id, user_id))
                 conn.commit()
@@ -1170,42 +1212,37 @@ def manage_schedule():
                               (SELECT id FROM subjects WHERE teacher_id = ?)''',
                               (assignment_id, user_id))
                 conn.commit()
+                _data_changed(user_id)
         else:
             subject_id = request.form['subject_id']
             day = request.form['day']
             period = request.form['period']
 
-            # Check for existing schedule in that time slot
-            cur.execute('''SELECT COUNT(*) as count FROM schedule 
-                          WHERE day = ? AND period = ? AND subject_id IN 
-                          (SELECT id FROM subjects WHERE teacher_id = ?)''', 
-                          (day, period, user_id))
-            if cur.fetchone()['count'] == 0:
-                cur.execute('''INSERT INTO schedule (subject_id, day, period) 
-                              VALUES (?, ?, ?)''', (subject_id, day, period))
-                conn.commit()
+            # Add the class unless the teacher already has one in that time slot;
+            # the subject has to be one of the teacher's own
+            cur.execute('''INSERT INTO schedule (subject_id, day, period) 
+                          SELECT id, ?, ? FROM subjects
+                          WHERE id = ? AND teacher_id = ?
+                          AND NOT EXISTS (SELECT 1 FROM schedule
+                                          WHERE day = ? AND period = ? AND subject_id IN 
+                                          (SELECT id FROM subjects WHERE teacher_id = ?))''', 
+                          (day, period, subject_id, user_id, day, period, user_id))
+            conn.commit()
 
-    # Get current schedule
-    cur.execute('''SELECT schedule.*, subjects.name as subject_name 
+    # Get current schedule; rows are deleted by rowid, which is also the id column
+    # where the table has one
+    cur.execute('''SELECT schedule.*, schedule.rowid as id, subjects.name as subject_name 
                    FROM schedule
                    JOIN subjects ON schedule.subject_id = subjects.id
                    WHERE subjects.teacher_id = ?
-                   ORDER BY 
-                     CASE schedule.day
-                       WHEN 'Monday' THEN 1
-                       WHEN 'Tuesday' THEN 2
-                       WHEN 'Wednesday' THEN 3
-                       WHEN 'Thursday' THEN 4
-                       WHEN 'Friday' THEN 5
-                     END,
-                     schedule.period''', (user_id,))
+                   ORDER BY schedule.day_index, schedule.period''', (user_id,))
     schedule = cur.fetchall()
 
     return render_template('manage_schedule.html', 
                          subjects=subjects,
                          schedule=schedule,
-                         days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
-                         periods=range(1, 9))
+                         days=SCHOOL_DAYS,
+                         periods=PERIODS)
 
 # --- Announcements System ---
 
@@ -1320,25 +1357,26 @@ def gradebook(subject_id):
     
     if request.method == 'POST':
         # Handle grade updates
-        for key, value in request.form.items():
-            if key.startswith('grade_'):
-                # Parse student_id and assignment_id from form key
-                _, student_id, assignment_id = key.split('_')
-                grade = float(value) if value.strip() else None
-                
-                if grade is not None:
-                    # Update or insert grade
-                    cur.execute('''INSERT OR REPLACE INTO assignments 
-                                  (user_id, subject_id, name, grade) 
-                                  VALUES (?, ?, 
-                                    (SELECT name FROM assignments WHERE id = ?), 
-                                    ?)''', 
-                               (int(student_id), subject_id, int(assignment_id), grade))
-                else:
-                    # Remove grade if empty
-                    cur.execute('DELETE FROM assignments WHERE user_id = ? AND subject_id = ? AND id = ?',
-                               (int(student_id), subject_id, int(assignment_id)))
-        conn.commit()
+        with db_transaction():
+            for key, value in request.form.items():
+                if key.startswith('grade_'):
+                    # Parse student_id and assignment_id from form key
+                    _, student_id, assignment_id = key.split('_')
+                    grade = float(value) if value.strip() else None
+                    
+                    if grade is not None:
+                        # Update or insert grade
+                        cur.execute('''INSERT OR REPLACE INTO assignments 
+                                      (user_id, subject_id, name, grade) 
+                                      VALUES (?, ?, 
+                                        (SELECT name FROM assignments WHERE id = ?), 
+                                        ?)''', 
+                                   (int(student_id), subject_id, int(assignment_id), grade))
+                    else:
+                        # Remove grade if empty
+                        cur.execute('DELETE FROM assignments WHERE user_id = ? AND subject_id = ? AND id = ?',
+                                   (int(student_id), subject_id, int(assignment_id)))
+        _data_changed(user_id)
         return redirect(url_for('gradebook', subject_id=subject_id))
     
     # Get all students enrolled in this subject
@@ -1415,21 +1453,13 @@ def student_schedule():
                    JOIN enrollments ON subjects.id = enrollments.subject_id
                    LEFT JOIN users ON subjects.teacher_id = users.id
                    WHERE enrollments.user_id = ? AND (schedule.week_type = ? OR schedule.week_type = 'both')
-                   ORDER BY 
-                     CASE schedule.day
-                       WHEN 'Monday' THEN 1
-                       WHEN 'Tuesday' THEN 2
-                       WHEN 'Wednesday' THEN 3
-                       WHEN 'Thursday' THEN 4
-                       WHEN 'Friday' THEN 5
-                     END,
-                     schedule.period''', (user_id, current_week))
+                   ORDER BY schedule.day_index, schedule.period''', (user_id, current_week))
     schedule_data = cur.fetchall()
     
     # Organize schedule by day and period
     schedule_grid = {}
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    periods = range(1, 9)  # Assuming 8 periods per day
+    days = SCHOOL_DAYS
+    periods = PERIODS
     
     for day in days:
         schedule_grid[day] = {}
@@ -1453,10 +1483,25 @@ def student_schedule():
                          subjects=subjects)
 
 # --- Initialize Database ---
+# Set once _init_schema has run in this process
+_schema_ready = False
+_schema_lock = threading.Lock()
+
 def init_db():
+    """Create the schema and demo data on a pooled connection"""
+    global _schema_ready
+    with app.app_context():
+        with _schema_lock:
+            _init_schema()
+            _schema_ready = True
+    if DATABASE != ':memory:':
+        # Don't leave an open connection behind for a forked worker to inherit
+        _pool.close_idle()
+
+def _init_schema():
     # For Vercel (in-memory) or if database doesn't exist locally
     if os.environ.get('VERCEL_DEPLOYMENT') or not os.path.exists(DATABASE):
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cur = conn.cursor()
 
         # Create tables...
@@ -1570,10 +1615,9 @@ def init_db():
             cur.execute('INSERT OR IGNORE INTO enrollments (user_id, subject_id) VALUES (3, 3)')
 
         conn.commit()
-        conn.close()
 
     # Always ensure announcements table exists (for both local and Vercel)
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute('''CREATE TABLE IF NOT EXISTS announcements (
         id INTEGER PRIMARY KEY,
@@ -1587,11 +1631,145 @@ def init_db():
         is_active BOOLEAN DEFAULT 1,
         FOREIGN KEY (author_id) REFERENCES users(id)
     )''')
-    conn.commit()
-    conn.close()
+
+    # Tables the dashboards, attendance, settings and schedule pages expect
+    cur.execute('''CREATE TABLE IF NOT EXISTS schedule (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        subject_id INTEGER,
+        day TEXT,
+        period INTEGER,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (subject_id) REFERENCES subjects(id)
+    )''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        subject_id INTEGER,
+        date TEXT,
+        present INTEGER
+    )''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY,
+        email_notifications BOOLEAN DEFAULT 0,
+        assignment_reminders BOOLEAN DEFAULT 0,
+        attendance_reminders BOOLEAN DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )''')
+    for statement in APP_INDEXES:
+        cur.execute(statement)
+
+    # Weekday number (Monday = 1) that schedule rows are sorted by, derived from the day name
+    cur.execute("SELECT 1 FROM pragma_table_xinfo('schedule') WHERE name = 'day_index'")
+    if not cur.fetchone():
+        cur.execute('''ALTER TABLE schedule ADD COLUMN day_index INTEGER GENERATED ALWAYS AS (
+            CASE day
+                WHEN 'Monday' THEN 1
+                WHEN 'Tuesday' THEN 2
+                WHEN 'Wednesday' THEN 3
+                WHEN 'Thursday' THEN 4
+                WHEN 'Friday' THEN 5
+            END) VIRTUAL''')
+
+    # Only some databases have a per-user schedule (schedule.user_id)
+    cur.execute("SELECT 1 FROM pragma_table_info('schedule') WHERE name = 'user_id'")
+    has_user_schedule = cur.fetchone() is not None
+    if has_user_schedule:
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_schedule_user_day ON schedule(user_id, day_index, period)")
+
+    # Time-slot lookups by subject, unless an index (such as the subject/day/period
+    # primary key) already leads with subject_id
+    cur.execute('''SELECT 1 FROM pragma_index_list('schedule') AS il
+                   JOIN pragma_index_info(il.name) AS ii
+                   WHERE ii.name = 'subject_id' AND ii.seqno = 0''')
+    if not cur.fetchone():
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_schedule_subject_slot ON schedule(subject_id, day, period)")
+
+    # Change counter per table, bumped on every write, so advanced_analytics can tell
+    # when the rows behind a cached result changed
+    cur.execute('''CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )''')
+    for table in VERSIONED_TABLES:
+        cur.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cur.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END''')
+
+    # Deleting a user or subject clears its rows in the child tables in the same statement
+    user_schedule = "DELETE FROM schedule WHERE user_id = OLD.id;" if has_user_schedule else ""
+    cur.execute(f'''CREATE TRIGGER IF NOT EXISTS delete_user_rows AFTER DELETE ON users
+        BEGIN
+            DELETE FROM assignments WHERE user_id = OLD.id;
+            DELETE FROM enrollments WHERE user_id = OLD.id;
+            DELETE FROM attendance WHERE user_id = OLD.id;
+            {user_schedule}
+        END''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS delete_subject_rows AFTER DELETE ON subjects
+        BEGIN
+            DELETE FROM assignments WHERE subject_id = OLD.id;
+            DELETE FROM enrollments WHERE subject_id = OLD.id;
+        END''')
+
+    # Running attendance totals per student and subject, kept current by triggers
+    # on attendance and filled from scratch when those triggers are first created
+    cur.execute('''SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN
+                   ('attendance_summary_insert', 'attendance_summary_delete', 'attendance_summary_update')''')
+    summary_maintained = cur.fetchone()[0] == 3
+    cur.execute('''CREATE TABLE IF NOT EXISTS attendance_summary (
+        user_id INTEGER,
+        subject_id INTEGER,
+        total INTEGER NOT NULL DEFAULT 0,
+        present INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, subject_id)
+    )''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS attendance_summary_insert AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO attendance_summary (user_id, subject_id, total, present)
+            VALUES (NEW.user_id, NEW.subject_id, 1, COALESCE(NEW.present, 0))
+            ON CONFLICT (user_id, subject_id) DO UPDATE
+            SET total = total + 1, present = present + excluded.present;
+        END''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS attendance_summary_delete AFTER DELETE ON attendance
+        BEGIN
+            UPDATE attendance_summary
+            SET total = total - 1, present = present - COALESCE(OLD.present, 0)
+            WHERE user_id = OLD.user_id AND subject_id = OLD.subject_id;
+        END''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS attendance_summary_update AFTER UPDATE ON attendance
+        BEGIN
+            UPDATE attendance_summary
+            SET total = total - 1, present = present - COALESCE(OLD.present, 0)
+            WHERE user_id = OLD.user_id AND subject_id = OLD.subject_id;
+            INSERT INTO attendance_summary (user_id, subject_id, total, present)
+            VALUES (NEW.user_id, NEW.subject_id, 1, COALESCE(NEW.present, 0))
+            ON CONFLICT (user_id, subject_id) DO UPDATE
+            SET total = total + 1, present = present + excluded.present;
+        END''')
+    if not summary_maintained:
+        with db_transaction():
+            cur.execute("DELETE FROM attendance_summary")
+            cur.execute('''INSERT INTO attendance_summary (user_id, subject_id, total, present)
+                           SELECT user_id, subject_id, COUNT(*), TOTAL(present)
+                           FROM attendance
+                           GROUP BY user_id, subject_id''')
 
     pass
 
+@app.before_request
+def _ensure_schema():
+    """Run _init_schema on the first request when the server was started without init_db"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            _init_schema()
+            _schema_ready = True
+
 # Register advanced feature modules
 if EMAIL_AVAILABLE:
     register_email_routes(app)
@@ -1607,6 +1785,7 @@ if ANALYTICS_AVAILABLE:
 
 if API_AVAILABLE:
     register_api(app)
+    on_data_change(_TEACHER_CACHE.clear)
     print("✓ API module loaded")
 
 if EXPORT_AVAILABLE:
@@ -0,0 +1,59 @@
+"""
+Database Connection Pool
+Bounded pool of tuned SQLite connections shared by the app and API request threads
+"""
+
+import queue
+import sqlite3
+import threading
+
+class PoolTimeout(Exception):
+    """No pooled connection came free within the pool's timeout"""
+
+class ConnectionPool:
+    def __init__(self, database: str, pragmas, size: int, timeout: float):
+        self.database = database
+        self.pragmas = pragmas
+        # Seconds a checkout waits for a free connection before raising PoolTimeout
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def connect(self):
+        """Open a tuned connection outside the pool"""
+        # Autocommit: every statement is its own transaction unless the caller opens one.
+        # Room for all of the routes' statements to stay prepared
+        conn = sqlite3.connect(self.database, check_same_thread=False, isolation_level=None,
+                               cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def checkout(self):
+        """Take a connection from the pool, opening one while the pool is below its size"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self.connect()
+            except sqlite3.Error:
+                self._slots.release()
+                raise
+
+    def checkin(self, conn):
+        """Return a connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        self._slots.release()
+
+    def close_idle(self):
+        """Close the connections waiting in the pool, e.g. before a worker fork"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -148,7 +148,7 @@ class DataExporter:
         """, (subject_id, subject_id))
         
         students = []
-        for row in cur.fetchall():
+        for row in cur:
             student = dict(row)
             student['average_grade'] = round(student['average_grade'] or 0, 2)
             students.append(student)
@@ -166,7 +166,7 @@ class DataExporter:
         """, (subject_id,))
         
         assignments = []
-        for row in cur.fetchall():
+        for row in cur:
             assignment = dict(row)
             assignment['average_grade'] = round(assignment['average_grade'] or 0, 2)
             assignments.append(assignment)